@@ -0,0 +1,297 @@
+from trading_signal import *
+from state_store import *
+import numpy as np
+import argparse
+import json
+import time
+
+# =======================================================
+# Backtesting
+# =======================================================
+
+# Replays a series of market states through the trading signal, the signal analysis and the lot rules of
+# trader.py against a simulated wallet. Everything that does not depend on the wallet (features, batch signal
+# scores, signal analysis, sell thresholds) is computed for all bars at once with NumPy, only the lot book is
+# walked bar by bar (lot rules are path dependent) and even there every lot is updated in one vector operation.
+
+# =======================================================
+# Market state sources
+# =======================================================
+
+def load_recorded_market_states(path=TRADING_STATE_FILE, journal_path=None):
+    """
+    Returns (timestamps, market_states, responses) of every state recorded by the trader.
+    `journal_path` defaults to the journal next to the state file (get_journal_path).
+    """
+    loaded_state = load_state_file(path, journal_path or get_journal_path(path))
+    if not loaded_state or not loaded_state.get("states"):
+        return [], [], []
+    states_list = [s for s in loaded_state["states"] if s.get("market_state")]
+    timestamps = [s["timestamp"] for s in states_list]
+    market_states = [expand_market_state(s["market_state"], loaded_state) for s in states_list]
+    responses = [s.get("responses", {"gemini": 0}) for s in states_list]
+    return timestamps, market_states, responses
+
+def generate_synthetic_market_states(bars, seed=0, interval_seconds=14400, start_price=30000.0, trader_config=None):
+    """
+    Builds `bars` synthetic market states (geometric brownian motion price path) with the same layout as
+    get_market_state(): weekly price history (newest first), dxy history, sentiment style indicators.
+    Returns (timestamps, market_states, responses).
+    """
+    trader_config = trader_config or config
+    rng = np.random.default_rng(seed)
+    bars_per_week = max(1, int(round(7 * 24 * 3600 / interval_seconds)))
+    history_length = max(trader_config["MA_LENGTH"] * 2, 120)
+    warmup = history_length * bars_per_week
+    total = warmup + bars
+
+    # Price path with slowly changing drift, so trends and crashes both happen
+    bar_vol = 0.65 / np.sqrt(365 * 24 * 3600 / interval_seconds)
+    drift = np.repeat(rng.normal(0.0, bar_vol * 0.15, total // (bars_per_week * 8) + 1), bars_per_week * 8)[:total]
+    prices = start_price * np.exp(np.cumsum(drift + rng.normal(0.0, bar_vol, total)))
+
+    # Weekly closes, the newest candle closes at the current price (week in progress)
+    bar_index = np.arange(total)
+    week_index = bar_index // bars_per_week
+    week_closes = prices[np.minimum((week_index[::bars_per_week] + 1) * bars_per_week - 1, total - 1)]
+
+    # Indicators loosely derived from the price path
+    month = 30 * 24 * 3600 // interval_seconds
+    momentum = prices / prices[np.maximum(bar_index - month, 0)] - 1.0
+    fear_greed = np.clip(50 + momentum * 250 + rng.normal(0, 5, total), 0, 100)
+    google_trends = np.clip(50 + momentum * 200 + rng.normal(0, 5, total), 0, 100)
+    news_sentiment = np.clip(np.round(momentum * 5 + rng.normal(0, 0.5, total)), -1, 1).astype(int)
+    gemini = np.clip(np.round(-momentum * 5 + rng.normal(0, 0.5, total)), -1, 1).astype(int)
+    halving_days = 4 * 365.25
+    days_since_halving = (bar_index * interval_seconds / 86400.0) % halving_days
+    long_ma = np.convolve(prices, np.ones(bars_per_week * 52) / (bars_per_week * 52), mode="full")[:total]
+    long_ma[:bars_per_week * 52] = prices[:bars_per_week * 52].mean()
+    ratio = prices / long_ma
+    band_edges = [0.5, 0.65, 0.8, 0.95, 1.15, 1.4, 1.8, 2.3]
+    band_colors = [
+        RainbowColor.BASICALLY_FIRE_SALE, RainbowColor.BUY, RainbowColor.ACCUMULATE, RainbowColor.STILL_CHEAP,
+        RainbowColor.HODL, RainbowColor.IS_THIS_A_BUBBLE, RainbowColor.FOMO_INTENSIFIES, RainbowColor.SELL_PLEASE,
+        RainbowColor.MAX_BUBBLE_TERRITORY,
+    ]
+    band_names = np.array([str(c) for c in band_colors])[np.digitize(ratio, band_edges)]
+    tradingview_names = np.array(["STRONG_SELL", "SELL", "NEUTRAL", "BUY", "STRONG_BUY"])[
+        np.digitize(momentum, [-0.2, -0.05, 0.05, 0.2])
+    ]
+    dxy_weekly = 100 + np.cumsum(rng.normal(0, 0.6, len(week_closes)))
+
+    timestamps, market_states, responses = [], [], []
+    start_time = time.time() - bars * interval_seconds
+    for i in range(warmup, total):
+        week = week_index[i]
+        weekly = np.append(week_closes[max(0, week - history_length + 1):week], prices[i])[::-1]
+        dxy = dxy_weekly[max(0, week - trader_config["DXY_LENGTH"] + 1):week + 1]
+        timestamps.append(start_time + (i - warmup) * interval_seconds)
+        market_states.append({
+            "current_price": float(prices[i]),
+            "price_history": weekly.tolist(),
+            "fear_greed": float(fear_greed[i]),
+            "btc_dom": 55.0,
+            "news_sentiment": int(news_sentiment[i]),
+            "days_until_next_halving": float(halving_days - days_since_halving[i]),
+            "days_since_last_halving": float(days_since_halving[i]),
+            "google_trends": float(google_trends[i]),
+            "rainbow_band": str(band_names[i]),
+            "tradingview_analysis": str(tradingview_names[i]),
+            "dxy_history": dxy.tolist(),
+        })
+        responses.append({"gemini": int(gemini[i])})
+    return timestamps, market_states, responses
+
+# =======================================================
+# Vectorized signal analysis
+# =======================================================
+
+def get_signal_analysis_batch(signals, trader_config=None):
+    """Vectorized get_signal_analysis(): the window of each state are the SIGNAL_ANALYSIS_COUNT states before it."""
+    trader_config = trader_config or config
+    window = trader_config["SIGNAL_ANALYSIS_COUNT"]
+    count = len(signals)
+    has_window = np.arange(count) >= window
+
+    def window_all(mask):
+        # Number of True values in mask[i - window:i] for every i
+        cumulative = np.concatenate(([0], np.cumsum(mask)))
+        start = np.maximum(np.arange(count) - window, 0)
+        return has_window & (cumulative[np.arange(count)] - cumulative[start] == window)
+
+    buy_signal = signals >= trader_config["BUY_SIGNAL_THRESHOLD"]
+    sell_signal = signals <= trader_config["SELL_SIGNAL_THRESHOLD"]
+    oldest = signals[np.maximum(np.arange(count) - window, 0)]
+    return {
+        "signal": signals,
+        "buy_signal": buy_signal,
+        "sell_signal": sell_signal,
+        "buy_confirmation": window_all(buy_signal),
+        "sell_confirmation": window_all(sell_signal),
+        "buy_signal_increasing": has_window & (signals - oldest >= 0),
+    }
+
+# =======================================================
+# Lot simulation
+# =======================================================
+
+def run_backtest(timestamps, market_states=None, responses=None, trader_config=None, features=None, signals=None,
+                 start_liquidity=10000.0, fee_rate=0.001, slippage=0.0005):
+    """
+    Replays market states through the trader rules against a simulated wallet.
+    `features` (from extract_signal_features) can be passed instead of market states, and `signals` (from the
+    batch scorer) on top of them, to reuse both across runs.
+    Returns a dict with the equity curve, PnL, max drawdown and the executed orders.
+    """
+    trader_config = trader_config or config
+    if features is None:
+        features = extract_signal_features(market_states, responses, trader_config)
+    prices = features["current_price"]
+    count = len(prices)
+
+    if signals is None:
+        signals = compile_signal_scorer(trader_config)(features)
+    analysis = get_signal_analysis_batch(signals, trader_config)
+
+    # Sell thresholds of every bar (sell_lots adjusts them with the signal analysis)
+    bearish = analysis["sell_signal"] & analysis["sell_confirmation"]
+    bullish = ~bearish & analysis["buy_signal"] & analysis["buy_confirmation"]
+    stop_slip = trader_config["TRAILING_STOP_LOSS_SLIP"]
+    profit_slip = trader_config["TAKE_PROFIT_SPLIP"]
+    trailing_stop_pct = np.full(count, float(trader_config["TRAILING_STOP_LOSS_PCT"]))
+    take_profit_pct = np.full(count, float(trader_config["TAKE_PROFIT_PCT"]))
+    trailing_stop_pct[bearish] = max(trader_config["TRAILING_STOP_LOSS_PCT"] - stop_slip, stop_slip)
+    take_profit_pct[bearish] = max(trader_config["TAKE_PROFIT_PCT"] - profit_slip, profit_slip)
+    trailing_stop_pct[bullish] += stop_slip
+    take_profit_pct[bullish] += profit_slip
+
+    buy_wanted = (
+        analysis["buy_signal"] & analysis["buy_confirmation"] & ~analysis["buy_signal_increasing"]
+        & (np.arange(count) >= trader_config["SIGNAL_ANALYSIS_COUNT"])
+    )
+
+    min_trade = trader_config["MIN_TRADE_QUANTITY_LIQUID"]
+    max_invested = trader_config["MAX_INVESTED_PERCENTAGE"]
+    buy_fraction = trader_config["MAX_INVESTED_PERCENTAGE"] * trader_config["BUY_QUANTITY_PERCENTAGE"]
+
+    liquidity = start_liquidity
+    quantity = 0.0
+    lot_quantity = np.empty(0)
+    lot_price = np.empty(0)
+    lot_high = np.empty(0)
+    equity = np.empty(count)
+    orders = []
+
+    for i in range(count):
+        price = prices[i]
+
+        # --- Sell lots ---
+        if len(lot_quantity) and quantity * price > min_trade:
+            lot_high = np.maximum(lot_high, price)
+            realized_pct = (price - lot_price) / lot_price
+            trailing_drawdown = (price - lot_high) / lot_high
+            stop = trailing_drawdown < -trailing_stop_pct[i]
+            take = ~stop & (realized_pct > take_profit_pct[i])
+            sold = stop | take
+            if sold.any():
+                fill_price = price * (1.0 - slippage)
+                for j in np.flatnonzero(sold):
+                    value = lot_quantity[j] * fill_price
+                    liquidity += value * (1.0 - fee_rate)
+                    quantity -= lot_quantity[j]
+                    orders.append({
+                        "type": "sell",
+                        "timestamp": timestamps[i],
+                        "price": fill_price,
+                        "quantity": float(lot_quantity[j]),
+                        "value": value,
+                        "info": "Trailing stop-loss triggered" if stop[j] else "Take-profit triggered",
+                    })
+                kept = ~sold
+                lot_quantity, lot_price, lot_high = lot_quantity[kept], lot_price[kept], lot_high[kept]
+
+        # --- Buy lots ---
+        if buy_wanted[i] and liquidity >= min_trade:
+            investment = quantity * price
+            if round(investment / (investment + liquidity), 2) < max_invested:
+                buy_quantity = (liquidity / price) * buy_fraction
+                fill_price = price * (1.0 + slippage)
+                value = buy_quantity * fill_price
+                liquidity -= value * (1.0 + fee_rate)
+                quantity += buy_quantity
+                lot_quantity = np.append(lot_quantity, buy_quantity)
+                lot_price = np.append(lot_price, price)
+                lot_high = np.append(lot_high, price)
+                orders.append({
+                    "type": "buy",
+                    "timestamp": timestamps[i],
+                    "price": fill_price,
+                    "quantity": float(buy_quantity),
+                    "value": value,
+                    "info": "Bullish signal buy",
+                })
+
+        equity[i] = liquidity + quantity * price
+
+    peaks = np.maximum.accumulate(equity) if count else equity
+    drawdowns = (peaks - equity) / peaks if count else equity
+    final_balance = float(equity[-1]) if count else start_liquidity
+    return {
+        "timestamps": np.asarray(timestamps),
+        "prices": prices,
+        "signals": signals,
+        "equity": equity,
+        "orders": orders,
+        "start_balance": start_liquidity,
+        "final_balance": final_balance,
+        "pnl": final_balance - start_liquidity,
+        "pnl_pct": final_balance / start_liquidity - 1.0,
+        "market_pct": float(prices[-1] / prices[0] - 1.0) if count else 0.0,
+        "max_drawdown": float(drawdowns.max()) if count else 0.0,
+        "open_lots": len(lot_quantity),
+    }
+
+def format_backtest_summary(result):
+    buys = sum(1 for o in result["orders"] if o["type"] == "buy")
+    sells = len(result["orders"]) - buys
+    return (
+        f"Bars: {len(result['equity'])}, Orders: {buys} buys / {sells} sells, Open lots: {result['open_lots']}\n"
+        f"Start balance: ${result['start_balance']:.2f}, Final balance: ${result['final_balance']:.2f}\n"
+        f"PnL: ${result['pnl']:+.2f} ({result['pnl_pct']:+.2%}), Market: {result['market_pct']:+.2%}, "
+        f"Max drawdown: {result['max_drawdown']:.2%}"
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Replay market states through the trading rules.")
+    parser.add_argument("--state", default=None, help="Recorded state file to replay (default: synthetic data)")
+    parser.add_argument("--journal", default=None, help="State journal of --state (default: the one next to it)")
+    parser.add_argument("--years", type=float, default=3.0, help="Years of synthetic bars")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic data seed")
+    parser.add_argument("--config", default=TRADER_FILE, help="Trader config to evaluate")
+    parser.add_argument("--liquidity", type=float, default=10000.0, help="Start liquidity")
+    parser.add_argument("--orders", default=None, help="Write the executed orders to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        trader_config = json.load(f)
+
+    if args.state:
+        timestamps, market_states, responses = load_recorded_market_states(args.state, args.journal)
+    else:
+        bars = int(args.years * 365 * 24 * 3600 / trader_config["TRADING_INTERVAL_SECONDS"])
+        timestamps, market_states, responses = generate_synthetic_market_states(
+            bars, seed=args.seed, interval_seconds=trader_config["TRADING_INTERVAL_SECONDS"], trader_config=trader_config
+        )
+    if not market_states:
+        logging.error("❌ No market states to replay.")
+        raise SystemExit(1)
+
+    started = time.perf_counter()
+    result = run_backtest(timestamps, market_states, responses, trader_config, start_liquidity=args.liquidity)
+    elapsed = time.perf_counter() - started
+    logging.info(f"📊 Backtest finished in {elapsed:.3f}s\n{format_backtest_summary(result)}")
+
+    if args.orders:
+        with open(args.orders, "w") as f:
+            json.dump(result["orders"], f, indent=4)
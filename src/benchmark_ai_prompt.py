@@ -0,0 +1,68 @@
+from backtest import *
+import argparse
+import statistics
+import time
+
+# =======================================================
+# AI prompt benchmark
+# =======================================================
+
+# Compares the raw market state prompt with the compact feature prompt: size, estimated tokens and,
+# with --live, the token count reported by Gemini and the response latency (the response cache is bypassed).
+
+def get_benchmark_market_state(state_path=None):
+    if state_path:
+        _, market_states, _ = load_recorded_market_states(state_path)
+        if market_states:
+            return market_states[-1]
+        logging.warning(f"⚠️ No recorded market states in {state_path}, using a synthetic one.")
+    _, market_states, _ = generate_synthetic_market_states(1)
+    return market_states[-1]
+
+def measure_latency(prompt, runs):
+    latencies, responses = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        responses.append(get_gemini_response(prompt))
+        latencies.append(time.perf_counter() - started)
+    return latencies, responses
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Compare the raw and the compact AI prompt.")
+    parser.add_argument("--state", default=None, help="Recorded state file (default: synthetic market state)")
+    parser.add_argument("--budget", type=int, default=None, help="Token budget (default: AI_PROMPT_TOKEN_BUDGET)")
+    parser.add_argument("--live", action="store_true", help="Also count tokens and time responses with Gemini")
+    parser.add_argument("--runs", type=int, default=5, help="Gemini calls per prompt with --live")
+    parser.add_argument("--show", action="store_true", help="Print the compact prompt")
+    args = parser.parse_args()
+
+    market_state = get_benchmark_market_state(args.state)
+    prompts = {
+        "raw": build_raw_ai_prompt(market_state),
+        "compact": build_ai_prompt(market_state, args.budget),
+    }
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        build_ai_prompt(market_state, args.budget)
+    build_ms = (time.perf_counter() - started)
+
+    for name, prompt in prompts.items():
+        logging.info(f"📊 {name:>8}: {len(prompt):6d} chars, ~{estimate_tokens(prompt):5d} tokens (estimated)")
+    logging.info(f"📊 Compact prompt is {len(prompts['compact']) / len(prompts['raw']):.1%} of the raw prompt, built in {build_ms:.3f} ms")
+    if args.show:
+        logging.info(f"\n{prompts['compact']}")
+
+    if args.live:
+        for name, prompt in prompts.items():
+            try:
+                tokens = gemini_client.models.count_tokens(model=GEMINI_MODEL, contents=prompt).total_tokens
+            except Exception as e:
+                logging.error(f"❌ Failed to count tokens: {e}")
+                tokens = None
+            latencies, responses = measure_latency(prompt, args.runs)
+            logging.info(
+                f"📊 {name:>8}: {tokens} tokens, latency median {statistics.median(latencies):.2f}s, "
+                f"max {max(latencies):.2f}s, responses {responses}"
+            )
@@ -0,0 +1,168 @@
+from config import *
+import numpy as np
+import logging
+import sqlite3
+import threading
+import time
+
+# =======================================================
+# Candle store
+# =======================================================
+
+# Full OHLCV klines per (symbol, interval) in SQLite. A sync only requests the candles newer than the last
+# stored one (the last stored candle is fetched again, it may still have been in progress), and history
+# beyond the 1000 candles the kline API returns per request is backfilled by paging backwards with `end`.
+# Once a backward page comes back short, the first listed candle is reached: it is recorded in candle_meta
+# and the backfill is not attempted again.
+
+KLINE_PAGE_LIMIT = 1000
+CANDLE_COLUMNS = ("time", "open", "high", "low", "close", "volume", "turnover")
+
+def get_interval_ms(interval):
+    """Candle length in milliseconds (months count as 28 days, the shortest, to never underestimate)."""
+    if interval == "D":
+        return 86400 * 1000
+    if interval == "W":
+        return 7 * 86400 * 1000
+    if interval == "M":
+        return 28 * 86400 * 1000
+    return int(interval) * 60 * 1000
+
+class CandleStore:
+    def __init__(self, path=CANDLE_DB_FILE, session=None, clock=None, category="linear"):
+        self.path = path
+        self.session = session
+        self.clock = clock
+        self.category = category
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS candles ("
+            "symbol TEXT, interval TEXT, start_ms INTEGER, "
+            "open REAL, high REAL, low REAL, close REAL, volume REAL, turnover REAL, "
+            "PRIMARY KEY (symbol, interval, start_ms))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS candle_meta ("
+            "symbol TEXT, interval TEXT, first_start_ms INTEGER, "
+            "PRIMARY KEY (symbol, interval))"
+        )
+
+    def now_ms(self):
+        return int((self.clock.time() if self.clock else time.time()) * 1000)
+
+    def get_bounds(self, symbol, interval):
+        """(count, oldest start, newest start) of the stored candles."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*), MIN(start_ms), MAX(start_ms) FROM candles WHERE symbol = ? AND interval = ?",
+                (symbol, interval)
+            ).fetchone()
+
+    def get_first_start(self, symbol, interval):
+        """Start of the first candle the exchange has (None until the backfill reached it)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT first_start_ms FROM candle_meta WHERE symbol = ? AND interval = ?", (symbol, interval)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_first_start(self, symbol, interval, start_ms):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO candle_meta VALUES (?, ?, ?)", (symbol, interval, start_ms))
+
+    def fetch_page(self, symbol, interval, limit, end=None):
+        kwargs = {"category": self.category, "symbol": symbol, "interval": interval, "limit": min(limit, KLINE_PAGE_LIMIT)}
+        if end is not None:
+            kwargs["end"] = end
+        response = self.session.get_kline(**kwargs)
+        if response.get("retCode", 0) != 0:
+            raise RuntimeError(f"get_kline failed: {response.get('retMsg')}")
+        return response["result"]["list"]  # Newest first
+
+    def store(self, symbol, interval, candles):
+        rows = [
+            (symbol, interval, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]),
+             float(k[5]) if len(k) > 5 else 0.0, float(k[6]) if len(k) > 6 else 0.0)
+            for k in candles
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def sync(self, symbol, interval, min_count=0):
+        """Fetches the candles newer than the stored ones, then backfills until `min_count` candles are stored."""
+        count, oldest, newest = self.get_bounds(symbol, interval)
+        requests_made = 0
+
+        # Forward: newest page first, paging back until the pages overlap the stored candles
+        missing = (self.now_ms() - newest) // get_interval_ms(interval) + 2 if newest is not None else max(min_count, 1)
+        end = None
+        while True:
+            page = self.fetch_page(symbol, interval, missing, end)
+            requests_made += 1
+            self.store(symbol, interval, page)
+            if not page or newest is None or int(page[-1][0]) <= newest or len(page) < min(missing, KLINE_PAGE_LIMIT):
+                break
+            end = int(page[-1][0]) - 1
+            missing -= len(page)
+
+        # Backward: older history until min_count (or the first listed candle) is reached
+        count, oldest, newest = self.get_bounds(symbol, interval)
+        first_start = self.get_first_start(symbol, interval)
+        while count < min_count and oldest is not None and (first_start is None or oldest > first_start):
+            requested = min(min_count - count, KLINE_PAGE_LIMIT)
+            page = self.fetch_page(symbol, interval, requested, end=oldest - 1)
+            requests_made += 1
+            self.store(symbol, interval, page)
+            count, oldest, newest = self.get_bounds(symbol, interval)
+            if len(page) < requested:
+                first_start = oldest
+                self.set_first_start(symbol, interval, first_start)
+                break
+        return requests_made
+
+    def get_candles(self, symbol, interval, limit=None, start=None, end=None):
+        """
+        Stored candles as {column: numpy array}, oldest first. `time` is the candle start in seconds,
+        `start`/`end` (seconds) bound it, `limit` keeps the newest ones.
+        """
+        conditions, params = ["symbol = ?", "interval = ?"], [symbol, interval]
+        if start is not None:
+            conditions.append("start_ms >= ?")
+            params.append(int(start * 1000))
+        if end is not None:
+            conditions.append("start_ms <= ?")
+            params.append(int(end * 1000))
+        sql = f"SELECT start_ms, open, high, low, close, volume, turnover FROM candles WHERE {' AND '.join(conditions)} ORDER BY start_ms DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()[::-1]
+        values = np.array(rows, dtype=float).reshape(len(rows), len(CANDLE_COLUMNS))
+        candles = {column: values[:, i] for i, column in enumerate(CANDLE_COLUMNS)}
+        candles["time"] = candles["time"] // 1000
+        return candles
+
+    def get_recent(self, symbol, interval, limit):
+        """Syncs, then returns the newest `limit` candles."""
+        if self.session is not None:
+            self.sync(symbol, interval, min_count=limit)
+        return self.get_candles(symbol, interval, limit=limit)
+
+if __name__ == "__main__":
+    import argparse
+    from trading_api import candle_store
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Sync and backfill the local candle store.")
+    parser.add_argument("--symbol", default=config["TRADING_SYMBOL"])
+    parser.add_argument("--interval", default="W", help="Kline interval (1, 5, 60, 240, D, W, M, ...)")
+    parser.add_argument("--count", type=int, default=1000, help="Candles to keep at least (paged beyond 1000)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    requests_made = candle_store.sync(args.symbol, args.interval, min_count=args.count)
+    count, oldest, newest = candle_store.get_bounds(args.symbol, args.interval)
+    logging.info(f"📊 {count} {args.symbol} {args.interval} candles stored ({requests_made} requests, {time.perf_counter() - started:.2f}s)")
@@ -1,21 +1,223 @@
 from google import genai
+from google.genai import types
 from config import *
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import logging
+import json
+import os
+import threading
+import time
 
 # =======================================================
 # Gemini API Functions
 # =======================================================
 
-gemini_client = genai.Client(api_key=api_keys["GEMINI_API_KEY"])
+GEMINI_MODEL = "gemini-2.0-flash"
 
-def get_gemini_response(prompt):
+# Requests still running after the vote deadline are abandoned, the timeout frees their threads eventually
+gemini_client = genai.Client(
+    api_key=api_keys["GEMINI_API_KEY"],
+    http_options=types.HttpOptions(timeout=int(config.get("AI_REQUEST_TIMEOUT_SECONDS", 60) * 1000)),
+)
+
+def get_gemini_response(prompt, model=GEMINI_MODEL):
     try:
         response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
+            model=model,
             contents=prompt,
         )
 
         return response.text
     except Exception as e:
         logging.error(f"❌ Error fetching Gemini response: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# =======================================================
+# Response cache
+# =======================================================
+
+class ResponseCache:
+    """
+    Persistent LRU cache of AI responses: key -> (response, creation time).
+    Entries expire after `ttl` seconds, the least recently used ones are evicted beyond `max_entries`.
+    Concurrent get_or_fetch() calls for the same key share a single in-flight fetch.
+    """
+    def __init__(self, path=AI_RESPONSE_CACHE_FILE, ttl=43200, max_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ Ignoring unreadable AI response cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["used"]):
+            if now - entry["created"] < self.ttl:
+                self.entries[key] = entry
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["created"] >= self.ttl:
+                self.entries.pop(key, None)
+                return None
+            entry["used"] = time.time()
+            self.entries.move_to_end(key)
+            return entry["response"]
+
+    def put(self, key, response):
+        with self.lock:
+            now = time.time()
+            self.entries[key] = {"response": response, "created": now, "used": now}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            try:
+                self.save()
+            except OSError as e:
+                logging.warning(f"⚠️ Failed to save AI response cache: {e}")
+
+    def get_or_fetch(self, key, fetch):
+        """Cached response for `key`, otherwise fetch() (None results are not cached)."""
+        response = self.get(key)
+        if response is not None:
+            with self.lock:
+                self.stats["hits"] += 1
+            return response
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            response = self.get(key)  # Another owner may have finished in between
+            if response is None:
+                response = fetch()
+                if response is not None:
+                    self.put(key, response)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+ai_cache_config = config.get("AI_RESPONSE_CACHE", {})
+ai_response_cache = ResponseCache(
+    ttl=ai_cache_config.get("TTL_SECONDS", 43200),
+    max_entries=ai_cache_config.get("MAX_ENTRIES", 256),
+)
+
+# =======================================================
+# AI providers
+# =======================================================
+
+class GeminiProvider:
+    cacheable = True
+
+    def __init__(self, name=None, model=GEMINI_MODEL, weight=1.0):
+        self.name = name or model
+        self.model = model
+        self.weight = weight
+
+    def get_response(self, prompt):
+        return get_gemini_response(prompt, self.model)
+
+class StubProvider:
+    """Offline provider answering `response` after `delay` seconds, for tests and runs without API access."""
+    cacheable = False
+
+    def __init__(self, name="stub", response="0", delay=0.0, weight=1.0):
+        self.name = name
+        self.response = response
+        self.delay = delay
+        self.weight = weight
+
+    def get_response(self, prompt):
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return self.response
+
+AI_PROVIDER_TYPES = {
+    "gemini": lambda c: GeminiProvider(c.get("NAME"), c.get("MODEL", GEMINI_MODEL), c.get("WEIGHT", 1.0)),
+    "stub": lambda c: StubProvider(c.get("NAME", "stub"), str(c.get("RESPONSE", 0)), c.get("DELAY_SECONDS", 0.0), c.get("WEIGHT", 1.0)),
+}
+
+def create_ai_providers(provider_configs):
+    if not isinstance(provider_configs, list) or not all(isinstance(c, dict) for c in provider_configs):
+        raise ValueError(f"AI_PROVIDERS must be a list of provider objects ({{\"TYPE\": ..., ...}}), got: {provider_configs!r}")
+    providers = []
+    for provider_config in provider_configs:
+        provider_type = provider_config.get("TYPE", "gemini")
+        if provider_type not in AI_PROVIDER_TYPES:
+            raise ValueError(f"Unknown AI provider type '{provider_type}'")
+        providers.append(AI_PROVIDER_TYPES[provider_type](provider_config))
+    names = [p.name for p in providers]
+    if len(set(names)) != len(names):
+        raise ValueError(f"AI provider names must be unique: {names}")
+    return providers
+
+ai_providers = create_ai_providers(config.get("AI_PROVIDERS", [{"TYPE": "gemini", "MODEL": GEMINI_MODEL}]))
+
+def get_provider_response(provider, prompt, cache_key):
+    """provider.get_response(), shared by every prompt whose market state has the same `cache_key`."""
+    if not provider.cacheable or not ai_cache_config.get("ENABLED", True):
+        return provider.get_response(prompt)
+    return ai_response_cache.get_or_fetch(f"{provider.name}:{cache_key}", lambda: provider.get_response(prompt))
+
+def get_ai_provider_responses(prompt, cache_key, providers=None, deadline=None):
+    """
+    Queries every provider in parallel and returns {provider name: raw response} of the providers that
+    answered within `deadline` seconds (AI_VOTE_DEADLINE_SECONDS by default). Late and failed providers are left out.
+    """
+    providers = providers if providers is not None else ai_providers
+    deadline = deadline if deadline is not None else config.get("AI_VOTE_DEADLINE_SECONDS", 20)
+    if not providers:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="ai_vote")
+    try:
+        futures = {executor.submit(get_provider_response, p, prompt, cache_key): p for p in providers}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in not_done:
+            logging.warning(f"⚠️ AI provider {futures[future].name} missed the {deadline}s deadline, vote skipped.")
+        responses = {}
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                logging.error(f"❌ AI provider {futures[future].name} failed: {e}")
+                continue
+            if response is not None:
+                responses[futures[future].name] = response
+        return responses
+    finally:
+        # Never wait for a slow model, a late answer still lands in the response cache for the next cycle
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -3,6 +3,12 @@ import os
 
 LOGGING_FILE = "log.txt"
 TRADING_STATE_FILE = "state.json"
+TRADING_JOURNAL_FILE = "state_journal.jsonl"
+HISTORY_DB_FILE = "history.db"
+AI_RESPONSE_CACHE_FILE = "ai_response_cache.json"
+INDICATOR_CACHE_FILE = "indicator_cache.json"
+CANDLE_DB_FILE = "candles.db"
+INSTRUMENT_INFO_FILE = "instrument_info.json"
 API_KEYS_FILE = "config/api_keys.json"
 TRADER_FILE = "config/trader.json"
 SERVER_FILE = "config/server.json"
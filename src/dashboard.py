@@ -7,6 +7,10 @@ import pandas as pd
 from datetime import datetime
 from config import *
 from trading_api import *
+from state_store import *
+from history_db import *
+from downsample import *
+import numpy as np
 import paramiko
 
 # =======================================================
@@ -14,6 +18,15 @@ import paramiko
 # =======================================================
 
 REFRESH_INTERVAL = 10  # seconds
+ACCOUNT_REFRESH_INTERVAL = 15  # seconds
+CHART_MAX_POINTS = 1000  # per series, longer histories are downsampled before rendering
+ZOOM_WINDOWS = {
+    "1W": 7 * 86400,
+    "1M": 30 * 86400,
+    "3M": 90 * 86400,
+    "1Y": 365 * 86400,
+    "All": None,
+}
 
 # Auto-refresh logic should be at the very top before any UI rendering
 if 'last_refresh' not in st.session_state:
@@ -25,11 +38,99 @@ else:
         load_trader_config()
         st.rerun()
 
-def load_state():
-    if os.path.exists(TRADING_STATE_FILE):
-        with open(TRADING_STATE_FILE, "r") as f:
-            return json.load(f)
-    return None
+@st.cache_resource
+def get_account_refresher():
+    # Balances and price come from a background thread, renders never wait on Bybit
+    return AccountRefresher(ACCOUNT_REFRESH_INTERVAL).start()
+
+@st.cache_resource
+def get_state_cache():
+    # Shared by every session and rerun, re-parses only what changed on disk
+    return StateFileCache()
+
+def load_chart_series(state):
+    """
+    Balance, price and signal series of the charts: read from the columnar history database (only these
+    columns), or from the recorded states when the trader did not write one yet.
+    """
+    if os.path.exists(HISTORY_DB_FILE):
+        history = query_history(["liquidity", "investment", "price", "signal"], path=HISTORY_DB_FILE)
+        if len(history["timestamp"]):
+            return {
+                "timestamp": history["timestamp"],
+                "Balance": np.nan_to_num(history["liquidity"]) + np.nan_to_num(history["investment"]),
+                "Price": np.nan_to_num(history["price"]),
+                "Signal": np.nan_to_num(history["signal"]),
+            }
+    states_list = state.get("states", [])
+    return {
+        "timestamp": np.array([s["timestamp"] for s in states_list], dtype=float),
+        "Balance": np.array([(s.get("liquidity") or 0) + (s.get("investment") or 0) for s in states_list], dtype=float),
+        "Price": np.array([s.get("price") or 0 for s in states_list], dtype=float),
+        "Signal": np.array([s.get("signal_analysis", {}).get("signal") or 0 for s in states_list], dtype=float),
+    }
+
+@st.cache_data(max_entries=2)
+def build_state_frames(version, _state):
+    """Derived tables of a state version, built once per change and shared by all tabs."""
+    states_list = _state.get("states", [])
+    orders = _state.get("orders", [])
+    times = [datetime.fromtimestamp(s["timestamp"]) for s in states_list]
+    return {
+        "series": load_chart_series(_state),
+        "order_lines": pd.DataFrame([
+            {
+                "Time": datetime.fromtimestamp(o["timestamp"]),
+                "Type": o["type"],
+                "Color": '#43a047' if o["type"] == "buy" else '#e53935'
+            }
+            for o in orders
+        ]),
+        "states_table": [
+            {
+                "Time": time_.strftime('%Y-%m-%d %H:%M:%S'),
+                "Price": s.get("price", "-"),
+                "Liquidity": s.get("liquidity", "-"),
+                "Investment": s.get("investment", "-"),
+                "Market State": s.get("market_state", {}),
+                "Responses": s.get("responses", {}),
+                "Quantity": s.get("quantity", "-"),
+                "Signal Analysis": s.get("signal_analysis", "-"),
+                "Paid for Investment": s.get("paid_for_investment", "-"),
+                "Lot Count": s.get("lot_count", "-"),
+            }
+            for time_, s in zip(times[::-1], states_list[::-1])
+        ],
+        "orders_table": [
+            {
+                "Type": t["type"].capitalize(),
+                "Time": datetime.fromtimestamp(t["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
+                "Price": f"${t.get('price', 0):.2f}",
+                "Quantity": t.get("quantity", "-"),
+                "Value": f"${t.get('value', 0):.2f}" if 'value' in t else "-",
+                "Info": t.get("info", "-"),
+            }
+            for t in orders[::-1]
+        ],
+    }
+
+@st.cache_data(max_entries=16)
+def build_chart_frame(version, _series, column, window, method="lttb"):
+    """(Time, column) frame of the zoom window, downsampled to CHART_MAX_POINTS."""
+    start = get_window_start(_series["timestamp"], ZOOM_WINDOWS[window])
+    timestamps = _series["timestamp"][start:]
+    values = _series[column][start:]
+    if method == "minmax":
+        indices = minmax_indices(values, CHART_MAX_POINTS)
+    else:
+        indices = lttb_indices(timestamps, values, CHART_MAX_POINTS)
+    return pd.DataFrame({
+        "Time": [datetime.fromtimestamp(t) for t in timestamps[indices]],
+        column: values[indices],
+    })
+
+def select_zoom_window(key):
+    return st.radio("Zoom", list(ZOOM_WINDOWS), index=len(ZOOM_WINDOWS) - 1, horizontal=True, key=key)
 
 def format_runtime(seconds):
     seconds = int(seconds)
@@ -43,7 +144,9 @@ def format_runtime(seconds):
     else:
         return f"{secs}s"
 
-state = load_state()
+state_cache = get_state_cache()
+state = state_cache.refresh()
+frames = build_state_frames(state_cache.version, state) if state else None
 
 st.set_page_config(page_title="Crypto Bot Dashboard", layout="wide")
 st.markdown("""
@@ -62,17 +165,24 @@ with tabs[0]:  # Status
     if state:
         col1, col2 = st.columns([1, 2], gap="large")
         with col1:
-            balance = get_current_balance()
-            start_balance = state['start_balance']
-            delta = (balance - start_balance) / start_balance * 100.0
-            market_delta = (get_price_for_symbol(config["TRADING_SYMBOL"]) - state['start_price']) / state['start_price'] * 100.0
-            liquidity = get_current_liquidity()
-            investment = get_current_investment()
-            invested_qty = get_balance_for_symbol(config["INVESTED_SYMBOL"])
-            runtime_str = format_runtime(time.time() - state["start_time"])
-
-            # Markdown table for aligned values
-            st.markdown(f'''
+            account_refresher = get_account_refresher()
+            snapshot = account_refresher.snapshot
+            if snapshot is None:
+                st.info("⏳ Waiting for the first account snapshot...")
+                if account_refresher.last_error:
+                    st.error(f"Account refresh failed: {account_refresher.last_error}")
+            else:
+                balance = snapshot.get_total_balance()
+                start_balance = state['start_balance']
+                delta = (balance - start_balance) / start_balance * 100.0
+                market_delta = (snapshot.price - state['start_price']) / state['start_price'] * 100.0
+                liquidity = snapshot.get_liquidity()
+                investment = snapshot.get_investment()
+                invested_qty = snapshot.get_balance(config["INVESTED_SYMBOL"])
+                runtime_str = format_runtime(time.time() - state["start_time"])
+
+                # Markdown table for aligned values
+                st.markdown(f'''
 <table style="font-size:1.1em;">
 <tr><td><b>Balance ({config['LIQUIDITY_SYMBOL']})</b></td><td style="text-align:right;color:#1976d2;"><b>${balance:.2f}</b></td></tr>
 <tr><td><b>Start Balance ({config['LIQUIDITY_SYMBOL']})</b></td><td style="text-align:right;color:#1976d2;">${start_balance:.2f}</td></tr>
@@ -84,39 +194,31 @@ with tabs[0]:  # Status
 <tr><td><b>Runtime</b></td><td style="text-align:right;color:#1976d2;">{runtime_str}</td></tr>
 </table>
 ''', unsafe_allow_html=True)
+
+                # Staleness indicator, the snapshot is older than a few refresh intervals when Bybit is unreachable
+                age = account_refresher.get_age()
+                if age > ACCOUNT_REFRESH_INTERVAL * 3:
+                    st.warning(f"⚠️ Account data is {format_runtime(age)} old" + (f": {account_refresher.last_error}" if account_refresher.last_error else ""))
+                else:
+                    st.caption(f"🕒 Account data updated {format_runtime(age)} ago")
         with col2:
             st.markdown("<h4 style='margin-bottom:0.2em;'>📉 All-Time Balance History</h4>", unsafe_allow_html=True)
             if state.get("states"):
-                states_list = state["states"]
-                balance_data = [
-                    {
-                        "Time": datetime.fromtimestamp(s["timestamp"]),
-                        "Balance": s.get("liquidity", 0) + s.get("investment", 0)
-                    }
-                    for s in states_list
-                ]
-                df_balance = pd.DataFrame(balance_data)
-                df_balance = df_balance.set_index("Time")
+                window = select_zoom_window("balance_zoom")
+                df_balance = build_chart_frame(state_cache.version, frames["series"], "Balance", window)
 
                 # Overlay buy/sell order vertical lines using Altair
                 import altair as alt
-                chart = alt.Chart(df_balance.reset_index()).mark_line(color='#1976d2').encode(
+                chart = alt.Chart(df_balance).mark_line(color='#1976d2').encode(
                     x=alt.X('Time:T', title='Time'),
                     y=alt.Y('Balance:Q', title='Balance')
                 )
 
                 # Prepare order vertical lines
                 if state.get("orders"):
-                    orders = state["orders"]
-                    order_lines = []
-                    for o in orders:
-                        color = '#43a047' if o["type"] == "buy" else '#e53935'
-                        order_lines.append({
-                            "Time": datetime.fromtimestamp(o["timestamp"]),
-                            "Type": o["type"],
-                            "Color": color
-                        })
-                    df_orders = pd.DataFrame(order_lines)
+                    df_orders = frames["order_lines"]
+                    if not df_orders.empty:
+                        df_orders = df_orders[df_orders["Time"] >= df_balance["Time"].iloc[0]]
                     if not df_orders.empty:
                         vline = alt.Chart(df_orders).mark_rule().encode(
                             x='Time:T',
@@ -139,21 +241,16 @@ with tabs[1]:  # States
     st.markdown("## State History")
     if state and state.get("states"):
         states_list = state["states"]
-        st.dataframe([
-            {
-                "Time": datetime.fromtimestamp(s["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
-                "Price": s.get("price", "-"),
-                "Liquidity": s.get("liquidity", "-"),
-                "Investment": s.get("investment", "-"),
-                "Market State": s.get("market_state", {}),
-                "Responses": s.get("responses", {}),
-                "Quantity": s.get("quantity", "-"),
-                "Signal Analysis": s.get("signal_analysis", "-"),
-                "Paid for Investment": s.get("paid_for_investment", "-"),
-                "Lot Count": s.get("lot_count", "-"),
-            }
-            for s in states_list[::-1]
-        ], use_container_width=True)
+        st.dataframe(frames["states_table"], use_container_width=True)
+
+        # Recorded market states keep long series as references, rebuild one on demand
+        with st.expander("🔍 Full market state"):
+            selected_index = st.selectbox(
+                "State",
+                options=range(len(states_list) - 1, -1, -1),
+                format_func=lambda i: datetime.fromtimestamp(states_list[i]["timestamp"]).strftime('%Y-%m-%d %H:%M:%S')
+            )
+            st.json(expand_market_state(states_list[selected_index].get("market_state", {}), state))
     else:
         st.info("No trading states yet.")
 
@@ -164,18 +261,7 @@ with tabs[1]:  # States
 with tabs[2]:  # Orders
     st.markdown("## Order History")
     if state and state.get("orders"):
-        trades = state["orders"]
-        st.dataframe([
-            {
-                "Type": t["type"].capitalize(),
-                "Time": datetime.fromtimestamp(t["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
-                "Price": f"${t.get('price', 0):.2f}",
-                "Quantity": t.get("quantity", "-"),
-                "Value": f"${t.get('value', 0):.2f}" if 'value' in t else "-",
-                "Info": t.get("info", "-"),
-            }
-            for t in trades[::-1]
-        ], use_container_width=True)
+        st.dataframe(frames["orders_table"], use_container_width=True)
     else:
         st.info("No trading orders yet.")
 
@@ -186,37 +272,36 @@ with tabs[2]:  # Orders
 with tabs[3]:  # Price & Signal
     st.markdown(f"<h2 style='text-align:left; font-size:1.6em;'>💹 {config['INVESTED_SYMBOL']} Price & Trading Signal History</h2>", unsafe_allow_html=True)
     if state and state.get("states"):
-        states_list = state["states"]
         buy_threshold = config.get("BUY_SIGNAL_THRESHOLD", 0.6)
         sell_threshold = config.get("SELL_SIGNAL_THRESHOLD", -0.5)
 
-        data = [
-            {
-                "Time": datetime.fromtimestamp(s["timestamp"]),
-                "Price": s.get("price", 0),
-                "Signal": s.get("signal_analysis", 0).get("signal", 0)
-            }
-            for s in states_list
-        ]
-        df = pd.DataFrame(data)
+        window = select_zoom_window("price_signal_zoom")
+        # The signal is compared against thresholds, min/max downsampling keeps every crossing visible
+        df_price = build_chart_frame(state_cache.version, frames["series"], "Price", window)
+        df_signal = build_chart_frame(state_cache.version, frames["series"], "Signal", window, method="minmax")
         import altair as alt
-        base = alt.Chart(df).encode(x=alt.X('Time:T', title='Time'))
-        price_line = base.mark_line(color='#1976d2').encode(
+        price_line = alt.Chart(df_price).mark_line(color='#1976d2').encode(
+            x=alt.X('Time:T', title='Time'),
             y=alt.Y('Price:Q', title=f'{config["INVESTED_SYMBOL"]} Price', axis=alt.Axis(titleColor='#1976d2'))
         )
         # Signal and thresholds share the same axis
-        signal_axis = alt.Y('Signal:Q', scale=alt.Scale(domain=[-1, 1]), title='Signal', axis=alt.Axis(titleColor='#ffd600'))
-        signal_line = base.mark_line(color='#ffd600').encode(y=signal_axis)
-        # Horizontal threshold lines as mark_line
-        buy_df = pd.DataFrame({'Time': df['Time'], 'y': [buy_threshold]*len(df)})
-        sell_df = pd.DataFrame({'Time': df['Time'], 'y': [sell_threshold]*len(df)})
-        buy_rule = alt.Chart(buy_df).mark_line(color='#43a047', strokeDash=[4,2]).encode(x='Time:T', y=alt.Y('y:Q', scale=alt.Scale(domain=[-1, 1])))
-        sell_rule = alt.Chart(sell_df).mark_line(color='#e53935', strokeDash=[4,2]).encode(x='Time:T', y=alt.Y('y:Q', scale=alt.Scale(domain=[-1, 1])))
+        signal_scale = alt.Scale(domain=[-1, 1])
+        signal_line = alt.Chart(df_signal).mark_line(color='#ffd600').encode(
+            x=alt.X('Time:T', title='Time'),
+            y=alt.Y('Signal:Q', scale=signal_scale, title='Signal', axis=alt.Axis(titleColor='#ffd600'))
+        )
+        # Horizontal threshold lines as constant rules
+        thresholds = pd.DataFrame({
+            'Signal': [buy_threshold, sell_threshold],
+            'Color': ['#43a047', '#e53935'],
+        })
+        threshold_rules = alt.Chart(thresholds).mark_rule(strokeDash=[4, 2]).encode(
+            y=alt.Y('Signal:Q', scale=signal_scale),
+            color=alt.Color('Color:N', scale=None, legend=None)
+        )
         chart = alt.layer(
             price_line,
-            signal_line,
-            buy_rule,
-            sell_rule
+            alt.layer(signal_line, threshold_rules)
         ).resolve_scale(
             y = 'independent'
         ).properties(width=900, height=400)
@@ -315,7 +400,7 @@ with tabs[6]:  # Edit Config
                 config_inputs[k] = config_form.checkbox(f"{k}", value=v)
             elif isinstance(v, (int, float)):
                 config_inputs[k] = config_form.text_input(f"{k}", value=str(v))
-            elif isinstance(v, dict):
+            elif isinstance(v, (dict, list)):
                 config_inputs[k] = config_form.text_area(f"{k} (JSON)", value=json.dumps(v, indent=2))
             else:
                 config_inputs[k] = config_form.text_input(f"{k}", value=str(v))
@@ -331,11 +416,14 @@ with tabs[6]:  # Edit Config
                         config_data[k] = type(config_data[k])(config_inputs[k])
                     except Exception:
                         config_data[k] = config_inputs[k]
-                elif isinstance(config_data[k], dict):
+                elif isinstance(config_data[k], (dict, list)):
                     try:
-                        config_data[k] = json.loads(config_inputs[k])
-                    except Exception:
-                        pass
+                        value = json.loads(config_inputs[k])
+                        if not isinstance(value, type(config_data[k])):
+                            raise ValueError(f"expected a JSON {type(config_data[k]).__name__}")
+                        config_data[k] = value
+                    except Exception as e:
+                        st.error(f"{k}: {e}. Kept the previous value.")
                 else:
                     config_data[k] = config_inputs[k]
             with open(TRADER_FILE, 'w') as f:
@@ -0,0 +1,65 @@
+import numpy as np
+
+# =======================================================
+# Chart downsampling
+# =======================================================
+
+# Long histories are reduced server-side before they are sent to the browser.
+# Both functions return the indices of the points to keep (sorted, first and last point included),
+# so several columns can be sliced consistently.
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets: keeps the point of each bucket that forms the largest triangle with the
+    previously kept point and the average of the next bucket. Preserves the visual shape of a line.
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # max_points - 2 buckets over the inner points, the first and last point are always kept
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    indices = np.empty(max_points, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+def minmax_indices(y, max_points):
+    """
+    Keeps the minimum and the maximum of each bucket. Every spike survives, which matters for series
+    that are compared against thresholds (the trading signal).
+    """
+    n = len(y)
+    if max_points >= n or max_points < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(0, n, (max_points - 2) // 2 + 1).astype(int)
+    indices = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = y[start:end]
+        indices.append(start + int(np.argmin(bucket)))
+        indices.append(start + int(np.argmax(bucket)))
+    return np.unique(indices)
+
+def get_window_start(timestamps, window_seconds):
+    """Index of the first timestamp inside the last `window_seconds` (None: the whole history)."""
+    if window_seconds is None or len(timestamps) == 0:
+        return 0
+    return int(np.searchsorted(timestamps, timestamps[-1] - window_seconds))
@@ -0,0 +1,305 @@
+from config import *
+from state_store import *
+from datetime import datetime, timezone
+from decimal import Decimal
+import bisect
+import itertools
+import logging
+import threading
+import time
+
+# =======================================================
+# Clocks
+# =======================================================
+
+class RealClock:
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock:
+    """
+    Simulated wall clock: sleep() advances it instantly (or `time_scale` real seconds per simulated second),
+    so the trader loop runs at accelerated time.
+    """
+    def __init__(self, start_time, time_scale=0.0):
+        self.now = start_time
+        self.time_scale = time_scale
+        self.lock = threading.Lock()
+
+    def time(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        if self.time_scale > 0:
+            time.sleep(seconds * self.time_scale)
+        with self.lock:
+            self.now += seconds
+
+# =======================================================
+# Market replay
+# =======================================================
+
+class MarketReplay:
+    """Recorded prices, market states and AI responses, looked up by (simulated) time."""
+    def __init__(self, timestamps, prices, market_states=None, responses=None):
+        self.timestamps = timestamps
+        self.prices = prices
+        self.market_states = market_states or []
+        self.responses = responses or []
+
+    @classmethod
+    def from_state_file(cls, path=TRADING_STATE_FILE, journal_path=TRADING_JOURNAL_FILE):
+        loaded_state = load_state_file(path, journal_path)
+        if not loaded_state or not loaded_state.get("states"):
+            raise ValueError(f"No recorded states to replay in {path}")
+        states_list = sorted(
+            (s for s in loaded_state["states"] if s.get("price")),
+            key=lambda s: s["timestamp"]
+        )
+        return cls(
+            timestamps=[s["timestamp"] for s in states_list],
+            prices=[s["price"] for s in states_list],
+            market_states=[expand_market_state(s.get("market_state", {}), loaded_state) for s in states_list],
+            responses=[s.get("responses", {"gemini": 0}) for s in states_list],
+        )
+
+    def index_at(self, timestamp):
+        return max(0, bisect.bisect_right(self.timestamps, timestamp) - 1)
+
+    def price_at(self, timestamp):
+        return self.prices[self.index_at(timestamp)]
+
+    def market_state_at(self, timestamp):
+        return self.market_states[self.index_at(timestamp)] if self.market_states else None
+
+    def responses_at(self, timestamp):
+        return self.responses[self.index_at(timestamp)] if self.responses else {"gemini": 0}
+
+    def finished(self, timestamp):
+        return timestamp > self.timestamps[-1]
+
+# =======================================================
+# Simulated exchange
+# =======================================================
+
+def kline_bucket_start(timestamp, interval):
+    """Start (seconds, UTC) of the Bybit kline of `interval` containing `timestamp`."""
+    if interval == "W":
+        monday = 4 * 86400  # 1970-01-05, first monday after the epoch
+        return timestamp - (timestamp - monday) % (7 * 86400)
+    if interval == "D":
+        return timestamp - timestamp % 86400
+    if interval == "M":
+        date = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        return datetime(date.year, date.month, 1, tzinfo=timezone.utc).timestamp()
+    seconds = int(interval) * 60
+    return timestamp - timestamp % seconds
+
+# Bybit spot BTCUSDT values
+SIMULATED_LOT_SIZE_FILTER = {
+    "basePrecision": "0.000001",
+    "quotePrecision": "0.00000001",
+    "minOrderQty": "0.000048",
+    "maxOrderQty": "71.73956243",
+    "minOrderAmt": "1",
+    "maxOrderAmt": "2000000",
+}
+
+class SimulatedExchange:
+    """
+    In-process stand-in for pybit's unified_trading.HTTP session.
+    Implements get_tickers, get_kline, get_wallet_balance, get_instruments_info, place_order (market orders)
+    and get_order_history on top of replayed prices, with configurable latency, fees and slippage.
+    Market buys are sized in the quote coin and sells in the base coin, like Bybit spot market orders,
+    and are rejected like Bybit does when they break the instrument's precision or minimum order size.
+    """
+    def __init__(self, replay, balances, symbol, base_coin, quote_coin,
+                 fee_rate=0.001, slippage=0.0005, latency=0.0, clock=None, lot_size_filter=None, tick_size="0.01"):
+        self.replay = replay
+        self.balances = dict(balances)
+        self.symbol = symbol
+        self.base_coin = base_coin
+        self.quote_coin = quote_coin
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.latency = latency
+        self.clock = clock or SimulatedClock(replay.timestamps[0])
+        self.lot_size_filter = dict(SIMULATED_LOT_SIZE_FILTER, **(lot_size_filter or {}))
+        self.tick_size = tick_size
+        self.orders = {}
+        self.order_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, simulated_config):
+        replay = MarketReplay.from_state_file(
+            simulated_config.get("REPLAY_FILE", TRADING_STATE_FILE),
+            simulated_config.get("REPLAY_JOURNAL_FILE", TRADING_JOURNAL_FILE),
+        )
+        return cls(
+            replay=replay,
+            balances=simulated_config.get("START_BALANCES", {config["LIQUIDITY_SYMBOL"]: 10000.0}),
+            symbol=config["TRADING_SYMBOL"],
+            base_coin=config["INVESTED_SYMBOL"],
+            quote_coin=config["LIQUIDITY_SYMBOL"],
+            fee_rate=simulated_config.get("FEE_RATE", 0.001),
+            slippage=simulated_config.get("SLIPPAGE", 0.0005),
+            latency=simulated_config.get("LATENCY_SECONDS", 0.0),
+            clock=SimulatedClock(replay.timestamps[0], simulated_config.get("TIME_SCALE", 0.0)),
+            lot_size_filter=simulated_config.get("LOT_SIZE_FILTER"),
+            tick_size=simulated_config.get("TICK_SIZE", "0.01"),
+        )
+
+    def simulate_latency(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def check_symbol(self, symbol):
+        if symbol != self.symbol:
+            raise ValueError(f"Simulated exchange only trades {self.symbol}, not {symbol}")
+
+    def get_tickers(self, category="linear", symbol=None, **kwargs):
+        self.simulate_latency()
+        self.check_symbol(symbol)
+        now = self.clock.time()
+        price = self.replay.price_at(now)
+        price_24h = self.replay.price_at(now - 86400)
+        return {
+            "retCode": 0,
+            "retMsg": "OK",
+            "result": {"category": category, "list": [{
+                "symbol": symbol,
+                "lastPrice": str(price),
+                "indexPrice": str(price),
+                "markPrice": str(price),
+                "prevPrice24h": str(price_24h),
+                "price24hPcnt": str(price / price_24h - 1.0),
+            }]},
+        }
+
+    def get_kline(self, category="linear", symbol=None, interval="D", limit=200, start=None, end=None, **kwargs):
+        """Candles built from the replayed prices up to the current simulated time, newest first."""
+        self.simulate_latency()
+        self.check_symbol(symbol)
+        end_time = min(self.clock.time(), end / 1000.0 if end is not None else float("inf"))
+        start_time = start / 1000.0 if start is not None else float("-inf")
+        candles = {}
+        for timestamp, price in zip(self.replay.timestamps, self.replay.prices):
+            if timestamp > end_time:
+                break
+            bucket = kline_bucket_start(timestamp, interval)
+            if bucket < start_time:
+                continue
+            if bucket not in candles:
+                candles[bucket] = [price, price, price, price]
+            else:
+                candle = candles[bucket]
+                candle[1] = max(candle[1], price)
+                candle[2] = min(candle[2], price)
+                candle[3] = price
+        newest_first = sorted(candles.items(), reverse=True)[:min(limit, 1000)]
+        return {
+            "retCode": 0,
+            "retMsg": "OK",
+            "result": {"category": category, "symbol": symbol, "list": [
+                [str(int(bucket * 1000)), str(o), str(h), str(l), str(c), "0", "0"]
+                for bucket, (o, h, l, c) in newest_first
+            ]},
+        }
+
+    def get_wallet_balance(self, accountType="UNIFIED", **kwargs):
+        self.simulate_latency()
+        with self.lock:
+            coins = [{"coin": coin, "walletBalance": str(balance)} for coin, balance in self.balances.items()]
+        return {"retCode": 0, "retMsg": "OK", "result": {"list": [{"accountType": accountType, "coin": coins}]}}
+
+    def get_instruments_info(self, category="spot", symbol=None, **kwargs):
+        self.simulate_latency()
+        self.check_symbol(symbol)
+        return {"retCode": 0, "retMsg": "OK", "result": {"category": category, "list": [{
+            "symbol": self.symbol,
+            "baseCoin": self.base_coin,
+            "quoteCoin": self.quote_coin,
+            "status": "Trading",
+            "lotSizeFilter": dict(self.lot_size_filter),
+            "priceFilter": {"tickSize": self.tick_size},
+        }]}}
+
+    def check_order_size(self, side, qty, price):
+        """Bybit's error for a market order breaking the lot size filter, None if it is valid."""
+        lot_size = {k: Decimal(v) for k, v in self.lot_size_filter.items()}
+        qty = Decimal(str(qty))
+        step = lot_size["quotePrecision"] if side == "Buy" else lot_size["basePrecision"]
+        if qty % step != 0:
+            return {"retCode": 170137, "retMsg": "Order quantity has too many decimals.", "result": {}}
+        if side == "Buy" and not lot_size["minOrderAmt"] <= qty <= lot_size["maxOrderAmt"]:
+            return {"retCode": 170140, "retMsg": "Order value exceeded lower limit.", "result": {}}
+        if side == "Sell" and (not lot_size["minOrderQty"] <= qty <= lot_size["maxOrderQty"]
+                               or qty * Decimal(str(price)) < lot_size["minOrderAmt"]):
+            return {"retCode": 170136, "retMsg": "Order quantity exceeded lower limit.", "result": {}}
+        return None
+
+    def place_order(self, category="spot", symbol=None, side=None, qty=None, **kwargs):
+        self.simulate_latency()
+        self.check_symbol(symbol)
+        order_type = kwargs.get("orderType", kwargs.get("order_type"))
+        if order_type != "Market":
+            return {"retCode": 10001, "retMsg": "Simulated exchange only supports market orders", "result": {}}
+
+        error = self.check_order_size(side, qty, self.replay.price_at(self.clock.time()))
+        if error is not None:
+            return error
+        qty = float(qty)
+        price = self.replay.price_at(self.clock.time())
+        with self.lock:
+            if side == "Buy":
+                fill_price = price * (1.0 + self.slippage)
+                cost = qty  # Quote coin amount
+                if cost <= 0 or self.balances.get(self.quote_coin, 0.0) < cost:
+                    return {"retCode": 170131, "retMsg": "Insufficient balance.", "result": {}}
+                executed_qty = cost / fill_price
+                fee = executed_qty * self.fee_rate  # Buy fees are paid in the base coin
+                self.balances[self.quote_coin] -= cost
+                self.balances[self.base_coin] = self.balances.get(self.base_coin, 0.0) + executed_qty - fee
+            elif side == "Sell":
+                fill_price = price * (1.0 - self.slippage)
+                executed_qty = qty
+                if qty <= 0 or self.balances.get(self.base_coin, 0.0) < qty:
+                    return {"retCode": 170131, "retMsg": "Insufficient balance.", "result": {}}
+                fee = qty * fill_price * self.fee_rate  # Sell fees are paid in the quote coin
+                self.balances[self.base_coin] -= qty
+                self.balances[self.quote_coin] = self.balances.get(self.quote_coin, 0.0) + qty * fill_price - fee
+            else:
+                return {"retCode": 10001, "retMsg": f"Invalid side {side}", "result": {}}
+
+            order_id = f"sim-{next(self.order_ids)}"
+            self.orders[order_id] = {
+                "orderId": order_id,
+                "symbol": symbol,
+                "side": side,
+                "orderType": "Market",
+                "orderStatus": "Filled",
+                "qty": str(qty),
+                "cumExecQty": str(executed_qty),
+                "avgPrice": str(fill_price),
+                "cumExecFee": str(fee),
+                "createdTime": str(int(self.clock.time() * 1000)),
+                "updatedTime": str(int(self.clock.time() * 1000)),
+            }
+        return {"retCode": 0, "retMsg": "OK", "result": {"orderId": order_id, "orderLinkId": ""}}
+
+    def get_order_history(self, category="spot", symbol=None, orderId=None, limit=50, **kwargs):
+        self.simulate_latency()
+        with self.lock:
+            if orderId is not None:
+                orders = [self.orders[orderId]] if orderId in self.orders else []
+            else:
+                orders = list(self.orders.values())[::-1][:limit]
+        return {"retCode": 0, "retMsg": "OK", "result": {"category": category, "list": [dict(o) for o in orders]}}
+
+    def replay_finished(self):
+        return self.replay.finished(self.clock.time())
@@ -0,0 +1,103 @@
+from config import *
+from state_store import *
+from contextlib import closing
+import numpy as np
+import logging
+import sqlite3
+import os
+
+# =======================================================
+# Columnar history store
+# =======================================================
+
+# One row per recorded trading cycle, one typed column per value.
+# Range queries only read the requested columns and the rows in the time range.
+# (name, SQL type, getter on a recorded state entry)
+HISTORY_COLUMNS = [
+    ("timestamp", "REAL", lambda s: s["timestamp"]),
+    ("price", "REAL", lambda s: s.get("price")),
+    ("liquidity", "REAL", lambda s: s.get("liquidity")),
+    ("investment", "REAL", lambda s: s.get("investment")),
+    ("quantity", "REAL", lambda s: s.get("quantity")),
+    ("paid_for_investment", "REAL", lambda s: s.get("paid_for_investment")),
+    ("lot_count", "INTEGER", lambda s: s.get("lot_count")),
+    ("signal", "REAL", lambda s: s.get("signal_analysis", {}).get("signal")),
+    ("buy_signal", "INTEGER", lambda s: s.get("signal_analysis", {}).get("buy_signal")),
+    ("sell_signal", "INTEGER", lambda s: s.get("signal_analysis", {}).get("sell_signal")),
+    ("fear_greed", "REAL", lambda s: s.get("market_state", {}).get("fear_greed")),
+    ("btc_dom", "REAL", lambda s: s.get("market_state", {}).get("btc_dom")),
+    ("news_sentiment", "INTEGER", lambda s: s.get("market_state", {}).get("news_sentiment")),
+    ("days_until_next_halving", "REAL", lambda s: s.get("market_state", {}).get("days_until_next_halving")),
+    ("days_since_last_halving", "REAL", lambda s: s.get("market_state", {}).get("days_since_last_halving")),
+    ("google_trends", "REAL", lambda s: s.get("market_state", {}).get("google_trends")),
+    ("rainbow_band", "TEXT", lambda s: s.get("market_state", {}).get("rainbow_band")),
+    ("tradingview_analysis", "TEXT", lambda s: s.get("market_state", {}).get("tradingview_analysis")),
+    ("gemini", "REAL", lambda s: s.get("responses", {}).get("gemini")),
+]
+
+HISTORY_COLUMN_TYPES = {name: sql_type for name, sql_type, _ in HISTORY_COLUMNS}
+
+def connect_history(path=HISTORY_DB_FILE):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers (dashboard) never block the trader
+    columns = ", ".join(f"{name} {sql_type}" for name, sql_type, _ in HISTORY_COLUMNS[1:])
+    conn.execute(f"CREATE TABLE IF NOT EXISTS history (timestamp REAL PRIMARY KEY, {columns})")
+    return conn
+
+def insert_states(conn, states, replace=True):
+    names = [name for name, _, _ in HISTORY_COLUMNS]
+    sql = (
+        f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO history ({', '.join(names)}) "
+        f"VALUES ({', '.join('?' for _ in names)})"
+    )
+    with conn:
+        conn.executemany(sql, ([getter(s) for _, _, getter in HISTORY_COLUMNS] for s in states))
+
+def record_state(state_entry, path=HISTORY_DB_FILE):
+    try:
+        with closing(connect_history(path)) as conn:
+            insert_states(conn, [state_entry])
+    except Exception as e:
+        logging.error(f"❌ Failed to record state in history database: {e}")
+
+def backfill_history(states, path=HISTORY_DB_FILE):
+    """Inserts every recorded state that is not in the history database yet."""
+    with closing(connect_history(path)) as conn:
+        insert_states(conn, states, replace=False)
+
+def query_history(columns, start=None, end=None, path=HISTORY_DB_FILE):
+    """
+    Returns {column: numpy array} for the rows with start <= timestamp <= end (either bound may be None),
+    ordered by time. "timestamp" is always included.
+    """
+    columns = ["timestamp"] + [c for c in columns if c != "timestamp"]
+    for c in columns:
+        if c not in HISTORY_COLUMN_TYPES:
+            raise ValueError(f"Unknown history column '{c}'")
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp <= ?")
+        params.append(end)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with closing(connect_history(path)) as conn:
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM history{where} ORDER BY timestamp", params).fetchall()
+
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    return {
+        c: np.array(v, dtype=object if HISTORY_COLUMN_TYPES[c] == "TEXT" else float)
+        for c, v in zip(columns, values)
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    loaded_state = load_state_file()
+    if loaded_state and loaded_state.get("states"):
+        backfill_history(loaded_state["states"])
+        logging.info(f"📊 Backfilled {len(loaded_state['states'])} states into {HISTORY_DB_FILE}")
+    else:
+        logging.info("⚠️ No recorded states to backfill.")
@@ -0,0 +1,75 @@
+from config import *
+from collections import deque
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+import numpy as np
+import requests
+import threading
+import time
+
+# =======================================================
+# Pooled HTTP client
+# =======================================================
+
+# One requests.Session shared by every external data source: connections are kept alive and reused
+# (no DNS/TCP/TLS setup per call), at most HTTP_POOL_MAXSIZE connections are opened per host,
+# every request gets a default timeout and accepts gzip/deflate encoded responses.
+
+HTTP_LATENCY_SAMPLES = 500  # Latencies kept per host for the percentiles
+
+class HttpClient:
+    def __init__(self, timeout=10, pool_maxsize=4, max_hosts=16):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.latencies = {}  # host -> deque of seconds
+        self.counters = {}  # host -> {"requests": n, "errors": n}
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            self.record(host, time.perf_counter() - started, error=True)
+            raise
+        self.record(host, time.perf_counter() - started, error=response.status_code >= 400)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def record(self, host, latency, error=False):
+        with self.lock:
+            self.latencies.setdefault(host, deque(maxlen=HTTP_LATENCY_SAMPLES)).append(latency)
+            counters = self.counters.setdefault(host, {"requests": 0, "errors": 0})
+            counters["requests"] += 1
+            counters["errors"] += int(error)
+
+    def get_stats(self):
+        """Per host: request and error counts, p50/p95/max latency (milliseconds) over the last samples."""
+        with self.lock:
+            samples = {host: np.array(latencies) * 1000.0 for host, latencies in self.latencies.items()}
+            counters = {host: dict(c) for host, c in self.counters.items()}
+        return {
+            host: dict(
+                counters[host],
+                p50_ms=round(float(np.percentile(latencies, 50)), 1),
+                p95_ms=round(float(np.percentile(latencies, 95)), 1),
+                max_ms=round(float(latencies.max()), 1),
+            )
+            for host, latencies in samples.items()
+        }
+
+http_client = HttpClient(
+    timeout=config.get("HTTP_TIMEOUT_SECONDS", 10),
+    pool_maxsize=config.get("HTTP_POOL_MAXSIZE", 4),
+)
+
+def get_http_stats():
+    return http_client.get_stats()
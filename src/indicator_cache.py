@@ -0,0 +1,64 @@
+from config import *
+import logging
+import threading
+import time
+
+# =======================================================
+# Indicator cache
+# =======================================================
+
+# Slow-moving indicators (halving countdown, weekly DXY closes, Google Trends, rainbow band) are kept on disk
+# with the time they were fetched, and reused until their per-source TTL (INDICATOR_CACHE_TTL_SECONDS) expires.
+# The cache survives restarts, so a warm start or trading_signal_print.py skips those requests entirely.
+
+class IndicatorCache:
+    def __init__(self, path=INDICATOR_CACHE_FILE):
+        self.path = path
+        self.entries = {}  # name -> {"value": ..., "fetched_at": seconds}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"⚠️ Ignoring unreadable indicator cache {path}: {e}")
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+    def get(self, name, fetch, ttl, is_valid=None):
+        """
+        Returns (value, fetched_at): the cached value while it is younger than `ttl` seconds,
+        otherwise fetch() (stored only if is_valid(value), by default when it is not None).
+        A `ttl` of 0 disables caching for the source.
+        """
+        now = time.time()
+        if ttl > 0:
+            with self.lock:
+                entry = self.entries.get(name)
+            if entry is not None and now - entry["fetched_at"] < ttl:
+                return entry["value"], entry["fetched_at"]
+
+        value = fetch()
+        if ttl > 0 and (is_valid(value) if is_valid else value is not None):
+            with self.lock:
+                self.entries[name] = {"value": value, "fetched_at": now}
+                try:
+                    self.save()
+                except (OSError, TypeError, ValueError) as e:
+                    self.entries.pop(name, None)
+                    logging.warning(f"⚠️ Failed to save indicator cache for {name}: {e}")
+        return value, now
+
+    def invalidate(self, name=None):
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(name, None)
+            self.save()
+
+indicator_cache = IndicatorCache()
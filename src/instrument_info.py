@@ -0,0 +1,98 @@
+from config import *
+from indicator_cache import *
+from decimal import Decimal
+import logging
+import threading
+import time
+
+# =======================================================
+# Instrument info
+# =======================================================
+
+# Spot order constraints per symbol (Bybit get_instruments_info): quantity steps, minimum/maximum order size
+# and tick size. They rarely change, so they are kept on disk (INSTRUMENT_INFO_FILE) and refreshed every
+# INSTRUMENT_INFO_REFRESH_SECONDS. Quantities are rounded down to their step with Decimal arithmetic, and orders
+# the exchange would reject are refused before any request is made.
+
+def round_down_to_step(value, step):
+    """`value` rounded down to a multiple of `step` (a Decimal), exactly."""
+    return (Decimal(str(value)) // step) * step
+
+class InstrumentInfo:
+    """
+    Market buys are sized in the quote coin (quote_step, min/max_amount),
+    sells in the base coin (quantity_step, min/max_quantity, and min_amount for their value).
+    """
+    def __init__(self, symbol, info):
+        lot_size = info["lotSizeFilter"]
+        self.symbol = symbol
+        self.status = info.get("status", "Trading")
+        self.quantity_step = Decimal(lot_size["basePrecision"])
+        self.quote_step = Decimal(lot_size["quotePrecision"])
+        self.min_quantity = Decimal(lot_size["minOrderQty"])
+        self.max_quantity = Decimal(lot_size["maxOrderQty"])
+        self.min_amount = Decimal(lot_size["minOrderAmt"])
+        self.max_amount = Decimal(lot_size["maxOrderAmt"])
+        self.tick_size = Decimal(info["priceFilter"]["tickSize"])
+
+    def round_quantity(self, quantity):
+        return round_down_to_step(quantity, self.quantity_step)
+
+    def round_amount(self, amount):
+        return round_down_to_step(amount, self.quote_step)
+
+    def round_price(self, price):
+        return round_down_to_step(price, self.tick_size)
+
+    def check_buy(self, amount):
+        """Reason the exchange would reject a market buy of `amount` (quote coin, rounded), else None."""
+        if self.status != "Trading":
+            return f"{self.symbol} is not trading ({self.status})"
+        if amount < self.min_amount:
+            return f"order value {amount} is below the minimum of {self.min_amount}"
+        if amount > self.max_amount:
+            return f"order value {amount} is above the maximum of {self.max_amount}"
+        return None
+
+    def check_sell(self, quantity, price=None):
+        """Reason the exchange would reject a market sell of `quantity` (base coin, rounded) at about `price`, else None."""
+        if self.status != "Trading":
+            return f"{self.symbol} is not trading ({self.status})"
+        if quantity < self.min_quantity:
+            return f"quantity {quantity} is below the minimum of {self.min_quantity}"
+        if quantity > self.max_quantity:
+            return f"quantity {quantity} is above the maximum of {self.max_quantity}"
+        if price is not None and quantity * Decimal(str(price)) < self.min_amount:
+            return f"order value {quantity * Decimal(str(price)):.2f} is below the minimum of {self.min_amount}"
+        return None
+
+class InstrumentInfoCache:
+    """Instrument info per symbol, fetched once and kept in memory and on disk (`path`, None for memory only)."""
+    def __init__(self, session, path=INSTRUMENT_INFO_FILE, refresh_seconds=86400, category="spot"):
+        self.session = session
+        self.disk = IndicatorCache(path) if path else None
+        self.refresh_seconds = refresh_seconds
+        self.category = category
+        self.instruments = {}  # symbol -> (InstrumentInfo, fetched_at)
+        self.lock = threading.Lock()
+
+    def fetch(self, symbol):
+        response = self.session.get_instruments_info(category=self.category, symbol=symbol)
+        if response.get("retCode", 0) != 0 or not response["result"]["list"]:
+            raise RuntimeError(f"get_instruments_info failed for {symbol}: {response.get('retMsg')}")
+        return response["result"]["list"][0]
+
+    def get(self, symbol):
+        with self.lock:
+            cached = self.instruments.get(symbol)
+        if cached is not None and time.time() - cached[1] < self.refresh_seconds:
+            return cached[0]
+
+        if self.disk is not None:
+            info, fetched_at = self.disk.get(f"{self.category}:{symbol}", lambda: self.fetch(symbol), self.refresh_seconds)
+        else:
+            info, fetched_at = self.fetch(symbol), time.time()
+        instrument = InstrumentInfo(symbol, info)
+        with self.lock:
+            self.instruments[symbol] = (instrument, fetched_at)
+        return instrument
@@ -0,0 +1,192 @@
+import heapq
+import itertools
+
+# =======================================================
+# Lot book
+# =======================================================
+
+# Open lots indexed for price updates:
+#  - Trailing highs live in groups (union-find). A price update raises every group whose high is below the
+#    price, those groups are merged into one group at the new high, so each lot is touched O(log n) amortized
+#    instead of on every tick. A lot's trailing high is the high of its root group.
+#  - A max-heap of group highs finds the trailing stops: the lots whose high is furthest above the price.
+#  - A min-heap of entry prices finds the take-profits: the lots bought the cheapest.
+# Both thresholds apply to every lot alike, so these orders are the orders of the stop and take-profit prices.
+# Heap entries are removed lazily (dead groups, sold lots are skipped when they surface).
+# Quantity, value and count of the open lots are kept as running aggregates.
+
+class HighGroup:
+    __slots__ = ("high", "parent", "lots", "size")
+
+    def __init__(self, high, lots):
+        self.high = high
+        self.parent = None
+        self.lots = lots  # May contain removed lots, `size` counts the open ones
+        self.size = len(lots)
+
+    def find(self):
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        node = self
+        while node.parent is not None and node.parent is not root:  # Path compression
+            node.parent, node = root, node.parent
+        return root
+
+class Lot:
+    __slots__ = ("id", "quantity", "price", "value", "group", "open")
+
+    def __init__(self, quantity, price, value):
+        self.id = None
+        self.quantity = quantity
+        self.price = price
+        self.value = value
+        self.group = None
+        self.open = False
+
+    @property
+    def trailing_high(self):
+        return self.group.find().high
+
+    def to_dict(self):
+        return {
+            "quantity": self.quantity,
+            "price": self.price,
+            "value": self.value,
+            "trailing_high": self.trailing_high,
+        }
+
+class LotBook:
+    def __init__(self):
+        self.lots = {}  # id -> open Lot
+        self.ids = itertools.count()
+        self.low_groups = []  # (high, sequence, group), lowest high first
+        self.high_groups = []  # (-high, sequence, group), highest high first
+        self.entry_prices = []  # (price, id, lot), cheapest first
+        self.group_sequence = itertools.count()
+        self.total_quantity = 0.0
+        self.total_value = 0.0
+
+    def load(self, lots):
+        """Replaces the book with the lots of a state file ({"quantity", "price", "value", "trailing_high"} dicts)."""
+        self.__init__()
+        for lot in lots:
+            self.add(Lot(lot["quantity"], lot["price"], lot["value"]), lot.get("trailing_high", lot["price"]))
+        return self
+
+    def to_dicts(self):
+        """The open lots as state file dicts, in the order they were opened."""
+        return [lot.to_dict() for lot in self]
+
+    def __len__(self):
+        return len(self.lots)
+
+    def __iter__(self):
+        return iter(sorted(self.lots.values(), key=lambda lot: lot.id))
+
+    def push_group(self, group):
+        sequence = next(self.group_sequence)
+        heapq.heappush(self.low_groups, (group.high, sequence, group))
+        heapq.heappush(self.high_groups, (-group.high, sequence, group))
+
+    def add(self, lot, trailing_high=None):
+        """Opens `lot` with its own trailing high (default: its price). A removed lot added back keeps its place."""
+        if lot.id is None:
+            lot.id = next(self.ids)
+        lot.open = True
+        lot.group = HighGroup(lot.price if trailing_high is None else trailing_high, [lot])
+        self.push_group(lot.group)
+        heapq.heappush(self.entry_prices, (lot.price, lot.id, lot))
+        self.lots[lot.id] = lot
+        self.total_quantity += lot.quantity
+        self.total_value += lot.value
+        return lot
+
+    def remove(self, lot):
+        """Closes `lot`, its heap entries are dropped lazily."""
+        if not lot.open:
+            return
+        lot.open = False
+        lot.group.find().size -= 1
+        del self.lots[lot.id]
+        if self.lots:
+            self.total_quantity -= lot.quantity
+            self.total_value -= lot.value
+        else:
+            self.total_quantity = self.total_value = 0.0  # No rounding residue once the book is empty
+
+    def is_live(self, group):
+        return group.parent is None and group.size > 0
+
+    def raise_highs(self, price):
+        """Trailing highs below `price` become `price`: their groups are merged into one."""
+        merged = []
+        while self.low_groups and self.low_groups[0][0] < price:
+            _, _, group = heapq.heappop(self.low_groups)
+            if self.is_live(group):
+                merged.append(group)
+        if not merged:
+            return
+        # Small-to-large: the biggest member list is reused, the others are appended to it
+        merged.sort(key=lambda g: len(g.lots), reverse=True)
+        lots = merged[0].lots
+        for group in merged[1:]:
+            lots.extend(group.lots)
+        root = HighGroup(price, lots)
+        root.size = sum(group.size for group in merged)
+        for group in merged:
+            group.parent = root
+            group.lots = None
+        self.push_group(root)
+
+    def get_highest_group(self):
+        while self.high_groups and not self.is_live(self.high_groups[0][2]):
+            heapq.heappop(self.high_groups)
+        return self.high_groups[0][2] if self.high_groups else None
+
+    def get_cheapest_lot(self):
+        while self.entry_prices and not self.entry_prices[0][2].open:
+            heapq.heappop(self.entry_prices)
+        return self.entry_prices[0][2] if self.entry_prices else None
+
+    def is_stop_triggered(self, group, price, trailing_stop_pct):
+        # Trailing stop-loss: drawdown from the trailing high beyond trailing_stop_pct
+        return group is not None and (price - group.high) / group.high < -trailing_stop_pct
+
+    def is_take_profit_triggered(self, lot, price, take_profit_pct):
+        # Take profit: gain from the entry price beyond take_profit_pct
+        return lot is not None and (price - lot.price) / lot.price > take_profit_pct
+
+    def has_triggered(self, price, trailing_stop_pct, take_profit_pct):
+        """Raises the trailing highs to `price`, True if any stop-loss or take-profit triggered (only heap tops are checked)."""
+        self.raise_highs(price)
+        return (self.is_stop_triggered(self.get_highest_group(), price, trailing_stop_pct)
+                or self.is_take_profit_triggered(self.get_cheapest_lot(), price, take_profit_pct))
+
+    def pop_triggered(self, price, trailing_stop_pct, take_profit_pct):
+        """
+        Raises the trailing highs to `price`, then removes and returns [(lot, "trailing_stop" | "take_profit")]
+        of the lots whose stop-loss or take-profit triggered, in the order they were opened.
+        A lot hitting both is a trailing stop. Lots that could not be sold can be add()ed back.
+        """
+        self.raise_highs(price)
+        triggered = []
+
+        group = self.get_highest_group()
+        while self.is_stop_triggered(group, price, trailing_stop_pct):
+            heapq.heappop(self.high_groups)
+            for lot in group.lots:
+                if lot.open:
+                    triggered.append((lot, "trailing_stop"))
+                    self.remove(lot)
+            group = self.get_highest_group()
+
+        lot = self.get_cheapest_lot()
+        while self.is_take_profit_triggered(lot, price, take_profit_pct):
+            heapq.heappop(self.entry_prices)
+            triggered.append((lot, "take_profit"))
+            self.remove(lot)
+            lot = self.get_cheapest_lot()
+
+        triggered.sort(key=lambda hit: hit[0].id)
+        return triggered
@@ -0,0 +1,236 @@
+from backtest import *
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import copy
+import csv
+import json
+import os
+import random
+import time
+
+# =======================================================
+# Parameter sweep optimizer
+# =======================================================
+
+# Sweeps trader.json parameters over recorded (or synthetic) history with the backtest engine.
+# Market state features are extracted once and shipped to every worker process once (pool initializer),
+# signal vectors are cached per worker by the config values the scorer reads (SIGNAL_SCORER_CONFIG_KEYS), so
+# candidates that only differ in trading thresholds or lot rules skip scoring entirely.
+# Keys that shape the features (SIGNAL_FEATURE_CONFIG_KEYS) cannot be swept.
+# Candidates are independent, so throughput scales with the worker count.
+
+# A list is a set of choices, a {"min": x, "max": y} dict a uniform range (random search only).
+# Nested keys use a dot: "SIGNAL_WEIGHTS.fear_greed".
+DEFAULT_SEARCH_SPACE = {
+    "BUY_SIGNAL_THRESHOLD": [0.2, 0.3, 0.4, 0.5, 0.6],
+    "SELL_SIGNAL_THRESHOLD": [-0.2, -0.3, -0.4, -0.5],
+    "TRAILING_STOP_LOSS_PCT": [0.1, 0.15, 0.2, 0.25],
+    "TAKE_PROFIT_PCT": [0.15, 0.25, 0.35],
+    "BUY_QUANTITY_PERCENTAGE": [0.1, 0.25, 0.5],
+}
+
+RESULTS_FILE = "optimization_results.csv"
+
+def apply_parameters(base_config, parameters):
+    candidate_config = copy.deepcopy(base_config)
+    for key, value in parameters.items():
+        target = candidate_config
+        *parents, leaf = key.split(".")
+        for parent in parents:
+            target = target[parent]
+        target[leaf] = value
+    return candidate_config
+
+def check_search_space(search_space):
+    """Rejects keys the sweep cannot vary: the features are extracted once, with the base config."""
+    fixed = [key for key in search_space if key.split(".")[0] in SIGNAL_FEATURE_CONFIG_KEYS]
+    if fixed:
+        raise ValueError(
+            f"Cannot sweep {', '.join(fixed)}: market features are extracted once from the base config. "
+            f"Set them in --config and run one sweep per value instead."
+        )
+
+def grid_candidates(search_space):
+    candidates = [{}]
+    for key, choices in search_space.items():
+        if not isinstance(choices, list):
+            raise ValueError(f"Grid search needs a list of choices for '{key}'")
+        candidates = [dict(c, **{key: v}) for c in candidates for v in choices]
+    return candidates
+
+def random_candidates(search_space, count, seed=0):
+    rng = random.Random(seed)
+    def sample(choices):
+        if isinstance(choices, list):
+            return rng.choice(choices)
+        return round(rng.uniform(choices["min"], choices["max"]), 4)
+    return [{key: sample(choices) for key, choices in search_space.items()} for _ in range(count)]
+
+# =======================================================
+# Worker
+# =======================================================
+
+worker_data = {}
+
+def init_worker(timestamps, features, base_config, metric, start_liquidity):
+    worker_data.update(
+        timestamps=timestamps,
+        features=features,
+        base_config=base_config,
+        metric=metric,
+        start_liquidity=start_liquidity,
+        signals_cache={},
+    )
+
+def get_cached_signals(candidate_config):
+    # Signals only depend on the config values the scorer reads
+    key = json.dumps({k: candidate_config.get(k) for k in SIGNAL_SCORER_CONFIG_KEYS}, sort_keys=True)
+    signals_cache = worker_data["signals_cache"]
+    if key not in signals_cache:
+        if len(signals_cache) >= 64:
+            signals_cache.pop(next(iter(signals_cache)))
+        signals_cache[key] = compile_signal_scorer(candidate_config)(worker_data["features"])
+    return signals_cache[key]
+
+def get_score(result, metric):
+    if metric == "calmar":
+        return result["pnl_pct"] / max(result["max_drawdown"], 0.01)
+    return result["pnl_pct"]
+
+def evaluate_candidate(task):
+    """Backtests one candidate on the last `bars` bars (None: all of them)."""
+    parameters, bars = task
+    candidate_config = apply_parameters(worker_data["base_config"], parameters)
+    signals = get_cached_signals(candidate_config)
+    features = worker_data["features"]
+    timestamps = worker_data["timestamps"]
+    if bars is not None:
+        features = {k: v[-bars:] for k, v in features.items()}
+        signals = signals[-bars:]
+        timestamps = timestamps[-bars:]
+    result = run_backtest(
+        timestamps, trader_config=candidate_config, features=features, signals=signals,
+        start_liquidity=worker_data["start_liquidity"]
+    )
+    return {
+        "parameters": parameters,
+        "score": get_score(result, worker_data["metric"]),
+        "pnl_pct": result["pnl_pct"],
+        "max_drawdown": result["max_drawdown"],
+        "orders": len(result["orders"]),
+        "bars": len(result["equity"]),
+    }
+
+# =======================================================
+# Search strategies
+# =======================================================
+
+def evaluate_all(executor, candidates, bars, workers):
+    chunksize = max(1, len(candidates) // (workers * 4))
+    return list(executor.map(evaluate_candidate, [(c, bars) for c in candidates], chunksize=chunksize))
+
+def successive_halving(executor, candidates, total_bars, workers, eta=3, min_bars=500):
+    """
+    Evaluates every candidate on the most recent slice of history, keeps the best 1/eta and grows the slice
+    eta times, until one candidate is left or the whole history is used.
+    """
+    rungs = 0  # Halvings until one candidate is left: the largest r with eta ** r <= len(candidates)
+    while eta ** (rungs + 1) <= len(candidates):
+        rungs += 1
+    bars = max(min(min_bars, total_bars), total_bars // (eta ** rungs))
+    eliminated = []
+    while True:
+        logging.info(f"📊 Successive halving: {len(candidates)} candidates on {bars} bars")
+        results = evaluate_all(executor, candidates, bars if bars < total_bars else None, workers)
+        if len(candidates) <= 1 or bars >= total_bars:
+            return results + eliminated
+        results.sort(key=lambda r: r["score"], reverse=True)
+        survivors = max(1, len(results) // eta)
+        candidates = [r["parameters"] for r in results[:survivors]]
+        eliminated = results[survivors:] + eliminated
+        bars = min(total_bars, bars * eta)
+
+def write_results(results, path=RESULTS_FILE):
+    # Candidates evaluated on more history (successive halving survivors) rank first
+    results = sorted(results, key=lambda r: (r["bars"], r["score"]), reverse=True)
+    parameter_keys = sorted({k for r in results for k in r["parameters"]})
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "score", "pnl_pct", "max_drawdown", "orders", "bars"] + parameter_keys)
+        for rank, r in enumerate(results, start=1):
+            writer.writerow(
+                [rank, f"{r['score']:.6f}", f"{r['pnl_pct']:.6f}", f"{r['max_drawdown']:.6f}", r["orders"], r["bars"]]
+                + [r["parameters"].get(k, "") for k in parameter_keys]
+            )
+    return results
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Sweep trader.json parameters over history.")
+    parser.add_argument("--strategy", choices=["grid", "random", "halving"], default="random")
+    parser.add_argument("--samples", type=int, default=200, help="Candidates for random and halving search")
+    parser.add_argument("--space", default=None, help="JSON file with the search space (default: built-in)")
+    parser.add_argument("--state", default=None, help="Recorded state file to replay (default: synthetic data)")
+    parser.add_argument("--journal", default=None, help="State journal of --state (default: the one next to it)")
+    parser.add_argument("--years", type=float, default=3.0, help="Years of synthetic bars")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default=TRADER_FILE, help="Base trader config")
+    parser.add_argument("--metric", choices=["pnl", "calmar"], default="pnl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--liquidity", type=float, default=10000.0)
+    parser.add_argument("--output", default=RESULTS_FILE, help="Ranked results table (CSV)")
+    parser.add_argument("--write-best", default=None, help="Write the best config to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        base_config = json.load(f)
+    search_space = DEFAULT_SEARCH_SPACE
+    if args.space:
+        with open(args.space, "r") as f:
+            search_space = json.load(f)
+    try:
+        check_search_space(search_space)
+    except ValueError as e:
+        logging.error(f"❌ {e}")
+        raise SystemExit(1)
+
+    if args.state:
+        timestamps, market_states, responses = load_recorded_market_states(args.state, args.journal)
+    else:
+        bars = int(args.years * 365 * 24 * 3600 / base_config["TRADING_INTERVAL_SECONDS"])
+        timestamps, market_states, responses = generate_synthetic_market_states(
+            bars, seed=args.seed, interval_seconds=base_config["TRADING_INTERVAL_SECONDS"], trader_config=base_config
+        )
+    if not market_states:
+        logging.error("❌ No market states to replay.")
+        raise SystemExit(1)
+    features = extract_signal_features(market_states, responses, base_config)
+    total_bars = len(timestamps)
+
+    if args.strategy == "grid":
+        candidates = grid_candidates(search_space)
+    else:
+        candidates = random_candidates(search_space, args.samples, seed=args.seed)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(timestamps, features, base_config, args.metric, args.liquidity)
+    ) as executor:
+        if args.strategy == "halving":
+            results = successive_halving(executor, candidates, total_bars, args.workers)
+        else:
+            results = evaluate_all(executor, candidates, None, args.workers)
+    elapsed = time.perf_counter() - started
+
+    results = write_results(results, args.output)
+    logging.info(f"📊 Evaluated {len(candidates)} candidates on {total_bars} bars in {elapsed:.2f}s with {args.workers} workers")
+    for rank, r in enumerate(results[:5], start=1):
+        logging.info(f"\t{rank}. score {r['score']:+.4f}, pnl {r['pnl_pct']:+.2%}, drawdown {r['max_drawdown']:.2%}, {r['parameters']}")
+    logging.info(f"📊 Ranked results written to {args.output}")
+
+    if args.write_best and results:
+        with open(args.write_best, "w") as f:
+            json.dump(apply_parameters(base_config, results[0]["parameters"]), f, indent=4)
+        logging.info(f"📊 Best config written to {args.write_best}")
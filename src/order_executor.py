@@ -0,0 +1,224 @@
+from collections import deque
+import numpy as np
+import logging
+import queue
+import threading
+import time
+
+# =======================================================
+# Order executor
+# =======================================================
+
+# Market orders are placed on a worker thread, so the trading loop never waits for the exchange.
+# Pending orders are then polled in batches (one order history request for every pending order) until they
+# reach a final status. The fill (executed quantity, average price, fee) is handed to the order callback,
+# along with the order-to-fill latency: order placement round-trip plus the time the exchange took to fill.
+# An order stays pending until the exchange reports a final status: when the lookup fails, or the order is still
+# not final after `fill_timeout`, it is looked up again with an exponential backoff (up to `max_backoff`), so an
+# API outage never turns into an unfilled order. Orders placed before a restart are tracked again with track().
+# Without a started worker (simulated runs) orders are placed and polled inline.
+
+ORDER_FINAL_STATUSES = {"Filled", "PartiallyFilledCanceled", "Cancelled", "Rejected", "Deactivated"}
+ORDER_LATENCY_SAMPLES = 500
+
+class OrderExecutor:
+    def __init__(self, session, symbol, category="spot", poll_interval=1.0, fill_timeout=60.0, max_backoff=300.0,
+                 history_limit=50):
+        self.session = session
+        self.symbol = symbol
+        self.category = category
+        self.poll_interval = poll_interval
+        self.fill_timeout = fill_timeout
+        self.max_backoff = max_backoff
+        self.history_limit = history_limit
+        self.submissions = queue.Queue()
+        self.pending = {}  # order id -> {"side", "qty", "callback", "submitted", "placed_latency", "next_poll", "retries"}
+        self.latencies = deque(maxlen=ORDER_LATENCY_SAMPLES)
+        self.counters = {"placed": 0, "filled": 0, "failed": 0, "rejected": 0, "lookup_retries": 0}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="order_executor", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, side, qty, callback, on_placed=None):
+        """
+        Places a market order for `qty` (quote coin for buys, base coin for sells), on_placed(order_id) is called
+        once the exchange accepted it. callback(fill) is called once the order is final: fill is None if nothing
+        was executed, else {"order_id", "status", "quantity", "price", "value", "fee", "latency"}.
+        """
+        if self.thread is None:
+            self.place(side, qty, callback, on_placed)
+            self.poll()
+        else:
+            self.submissions.put((side, qty, callback, on_placed))
+
+    def track(self, order_id, side, qty, callback):
+        """Tracks an order placed earlier (before a restart) until it is final, like a submitted one."""
+        logging.info(f"🔁 Tracking {side.lower()} order {order_id} for {qty} again.")
+        self.add_pending(order_id, side, qty, callback, time.monotonic(), 0.0)
+        if self.thread is None:
+            self.poll()
+
+    def add_pending(self, order_id, side, qty, callback, submitted, placed_latency):
+        with self.lock:
+            self.pending[order_id] = {
+                "side": side,
+                "qty": qty,
+                "callback": callback,
+                "submitted": submitted,
+                "placed_latency": placed_latency,
+                "next_poll": 0.0,
+                "retries": 0,
+            }
+
+    def reject(self, side, qty, reason, callback):
+        """Fails an order that was checked locally, without any request."""
+        logging.error(f"❌ {side} order for {qty} rejected locally: {reason}")
+        self.finish(callback, None, "rejected")
+
+    def place(self, side, qty, callback, on_placed=None):
+        submitted = time.monotonic()
+        try:
+            order = self.session.place_order(
+                category=self.category,
+                symbol=self.symbol,
+                side=side,
+                orderType="Market",
+                qty=str(qty),
+            )
+        except Exception as e:
+            logging.error(f"❌ Error placing {side.lower()} order for {qty}: {e}")
+            self.finish(callback, None, "failed")
+            return
+        if not order or order.get("retCode", 1) != 0:
+            error_msg = order.get("retMsg", "Unknown error") if order else "No response from API"
+            logging.error(f"❌ {side} order failed for {qty}: {error_msg}")
+            self.finish(callback, None, "failed")
+            return
+
+        order_id = order["result"]["orderId"]
+        logging.info(f"✅ {side} order placed for {qty} ({order_id})")
+        with self.lock:
+            self.counters["placed"] += 1
+        if on_placed is not None:
+            try:
+                on_placed(order_id)
+            except Exception as e:
+                logging.error(f"❌ Error in order placed callback: {e}")
+        self.add_pending(order_id, side, qty, callback, submitted, time.monotonic() - submitted)
+
+    def finish(self, callback, fill, outcome):
+        with self.lock:
+            self.counters[outcome] += 1
+            if fill is not None:
+                self.latencies.append(fill["latency"])
+        try:
+            callback(fill)
+        except Exception as e:
+            logging.error(f"❌ Error in order callback: {e}")
+
+    def get_order_updates(self, order_ids):
+        """Final orders by id: one history request for all of them, then single lookups for the ones it missed."""
+        response = self.session.get_order_history(category=self.category, symbol=self.symbol, limit=self.history_limit)
+        updates = {o["orderId"]: o for o in response["result"]["list"] if o["orderId"] in order_ids}
+        for order_id in set(order_ids) - set(updates):
+            orders = self.session.get_order_history(category=self.category, symbol=self.symbol, orderId=order_id)["result"]["list"]
+            if orders:
+                updates[order_id] = orders[0]
+        return {order_id: o for order_id, o in updates.items() if o.get("orderStatus") in ORDER_FINAL_STATUSES}
+
+    def retry_later(self, order_id, entry, now, failed):
+        """Schedules the next lookup of a pending order: every poll interval, with a backoff once it is late or failed."""
+        if not failed and now - entry["submitted"] < self.fill_timeout:
+            entry["next_poll"] = now + self.poll_interval
+            return
+        delay = min(self.poll_interval * 2 ** entry["retries"], self.max_backoff)
+        if entry["retries"] == 0 and not failed:
+            logging.warning(f"⚠️ No final status for order {order_id} after {self.fill_timeout:.0f}s, still checking.")
+        entry["retries"] += 1
+        entry["next_poll"] = now + delay
+        with self.lock:
+            self.counters["lookup_retries"] += 1
+
+    def poll(self):
+        now = time.monotonic()
+        with self.lock:
+            pending = {order_id: entry for order_id, entry in self.pending.items() if entry["next_poll"] <= now}
+        if not pending:
+            return
+        failed = False
+        try:
+            updates = self.get_order_updates(list(pending))
+        except Exception as e:
+            logging.error(f"❌ Error polling order status, retrying: {e}")
+            updates = {}
+            failed = True
+
+        now = time.monotonic()
+        for order_id, entry in pending.items():
+            order = updates.get(order_id)
+            if order is None:
+                self.retry_later(order_id, entry, now, failed)
+                continue
+            with self.lock:
+                self.pending.pop(order_id, None)
+
+            quantity = float(order.get("cumExecQty") or 0.0)
+            if quantity <= 0:
+                logging.error(f"❌ {entry['side']} order {order_id} was not executed: {order.get('orderStatus')}")
+                self.finish(entry["callback"], None, "failed")
+                continue
+            price = float(order.get("avgPrice") or 0.0)
+            exchange_fill_time = (int(order.get("updatedTime", 0)) - int(order.get("createdTime", 0))) / 1000.0
+            fill = {
+                "order_id": order_id,
+                "status": order["orderStatus"],
+                "quantity": quantity,
+                "price": price,
+                "value": float(order.get("cumExecValue") or quantity * price),
+                "fee": float(order.get("cumExecFee") or 0.0),
+                "latency": entry["placed_latency"] + max(exchange_fill_time, 0.0),
+            }
+            self.finish(entry["callback"], fill, "filled")
+
+    def run(self):
+        while True:
+            try:
+                # Wait for new orders, or only as long as the poll interval when orders are pending
+                # (the orders whose lookup is backed off are skipped by poll until they are due)
+                timeout = self.poll_interval if self.pending else None
+                submission = self.submissions.get(timeout=timeout)
+                self.place(*submission)
+                while not self.submissions.empty():
+                    self.place(*self.submissions.get_nowait())
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logging.error(f"❌ Error in order executor: {e}")
+            self.poll()
+
+    def flush(self, timeout=10.0):
+        """Waits until every submitted order is final (or `timeout` seconds passed), True if none is left."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.pending and self.submissions.empty():
+                    return True
+            time.sleep(min(self.poll_interval, 0.1))
+        return False
+
+    def get_stats(self):
+        """Order counts and order-to-fill latency p50/p95/max (milliseconds) over the last fills."""
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.0
+            stats = dict(self.counters, pending=len(self.pending))
+        if len(latencies):
+            stats.update(
+                p50_ms=round(float(np.percentile(latencies, 50)), 1),
+                p95_ms=round(float(np.percentile(latencies, 95)), 1),
+                max_ms=round(float(latencies.max()), 1),
+            )
+        return stats
@@ -1,20 +1,139 @@
 from config import *
+import argparse
+import os
+import time
 import paramiko
 
+# =======================================================
+# SFTP sync
+# =======================================================
+
+# One SSH transport and SFTP session serve every file of a sync (and every round in --interval mode).
+# A file whose size and mtime match the remote one is skipped (downloads copy the remote mtime).
+# Append-only files (log, state journal) are resumed from the local size, after checking that the
+# local tail still matches the remote bytes at the same position. A truncated or rewritten remote file is
+# downloaded again in full. Optional SSH compression (zlib) shrinks the transfer of text files.
+
+REMOTE_DIR = "/root/crypto-bot"
+SYNC_FILES = [
+    # (file name, append only)
+    (TRADING_STATE_FILE, False),
+    (TRADING_JOURNAL_FILE, True),
+    (LOGGING_FILE, True),
+]
+TAIL_CHECK_BYTES = 256
+CHUNK_SIZE = 1 << 20
+
+class ServerSync:
+    def __init__(self, compress=False):
+        self.compress = compress
+        self.transport = None
+        self.sftp = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        self.transport = paramiko.Transport((server_config["HOSTNAME"], server_config["PORT"]))
+        self.transport.use_compression(self.compress)
+        self.transport.set_keepalive(30)
+        self.transport.connect(username=server_config["USERNAME"], password=server_config["PASSWORD"])
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+        if self.transport is not None:
+            self.transport.close()
+        self.sftp = None
+        self.transport = None
+
+    def ensure_connected(self):
+        if self.transport is None or not self.transport.is_active():
+            self.close()
+            self.connect()
+
+    def sync_file(self, remote_path, local_path, append_only=False):
+        """Returns "skipped", "appended" or "downloaded"."""
+        self.ensure_connected()
+        remote_stat = self.sftp.stat(remote_path)
+        local_stat = os.stat(local_path) if os.path.exists(local_path) else None
+
+        if local_stat and local_stat.st_size == remote_stat.st_size and int(local_stat.st_mtime) == int(remote_stat.st_mtime):
+            return "skipped"
+
+        if append_only and local_stat and 0 < local_stat.st_size < remote_stat.st_size:
+            if self.append_tail(remote_path, local_path, local_stat.st_size, remote_stat.st_size):
+                os.utime(local_path, (remote_stat.st_atime, remote_stat.st_mtime))
+                return "appended"
+
+        temp_path = f"{local_path}.part"
+        self.sftp.get(remote_path, temp_path)
+        os.utime(temp_path, (remote_stat.st_atime, remote_stat.st_mtime))
+        os.replace(temp_path, local_path)
+        return "downloaded"
+
+    def append_tail(self, remote_path, local_path, offset, remote_size):
+        """Appends the remote bytes after `offset`, False if the local copy is not a prefix of the remote file."""
+        check_size = min(TAIL_CHECK_BYTES, offset)
+        with open(local_path, "rb") as f:
+            f.seek(offset - check_size)
+            local_tail = f.read(check_size)
+
+        with self.sftp.open(remote_path, "rb") as remote_file:
+            remote_file.seek(offset - check_size)
+            if remote_file.read(check_size) != local_tail:
+                return False
+            remote_file.prefetch(remote_size - offset)
+            with open(local_path, "ab") as f:
+                remaining = remote_size - offset
+                while remaining > 0:
+                    chunk = remote_file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        return True
+
+    def sync(self, files=SYNC_FILES, remote_dir=REMOTE_DIR, local_dir="."):
+        results = {}
+        for name, append_only in files:
+            try:
+                results[name] = self.sync_file(f"{remote_dir}/{name}", os.path.join(local_dir, name), append_only)
+            except FileNotFoundError:
+                results[name] = "missing"
+            except Exception as e:
+                print(f"Failed to sync {name} from server: {e}")
+                results[name] = "failed"
+        return results
+
 def download_file_from_server(remote_path, local_path):
     try:
-        transport = paramiko.Transport((server_config["HOSTNAME"], server_config["PORT"]))
-        transport.connect(username=server_config["USERNAME"], password=server_config["PASSWORD"])
-        sftp = paramiko.SFTPClient.from_transport(transport)
         remote_file_path = remote_path.format(TRADING_STATE_FILE=TRADING_STATE_FILE)
         local_file_path = local_path.format(TRADING_STATE_FILE=TRADING_STATE_FILE)
-        sftp.get(remote_file_path, local_file_path)
-        sftp.close()
-        transport.close()
+        with ServerSync() as server_sync:
+            server_sync.sync_file(remote_file_path, local_file_path)
     except Exception as e:
         print(f"Failed to download file from server: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the bot state and logs from the server.")
+    parser.add_argument("--compress", action="store_true", help="Enable SSH (zlib) compression")
+    parser.add_argument("--interval", type=float, default=0, help="Keep syncing every N seconds on the same connection")
+    args = parser.parse_args()
+
     load_server_config()
-    download_file_from_server(f"/root/crypto-bot/{TRADING_STATE_FILE}", f"{TRADING_STATE_FILE}")
-    download_file_from_server(f"/root/crypto-bot/{LOGGING_FILE}", f"{LOGGING_FILE}")
\ No newline at end of file
+    remote_dir = server_config.get("REMOTE_DIR", REMOTE_DIR)
+    compress = args.compress or server_config.get("COMPRESSION", False)
+    with ServerSync(compress=compress) as server_sync:
+        while True:
+            started = time.perf_counter()
+            results = server_sync.sync(remote_dir=remote_dir)
+            print(f"Synced in {time.perf_counter() - started:.2f}s: " + ", ".join(f"{k} {v}" for k, v in results.items()))
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
@@ -0,0 +1,352 @@
+from config import *
+import logging
+import hashlib
+import json
+import os
+import threading
+
+# =======================================================
+# State persistence
+# =======================================================
+
+# The snapshot (TRADING_STATE_FILE) holds the full state dict, like the legacy state.json (compact JSON),
+# plus "journal_offset" (where its journal tail starts) and "journal_generation" (which journal continues it).
+# The journal (TRADING_JOURNAL_FILE) is an append-only file of compact JSON lines:
+#   {"kind": "journal", "data": {...}}      -> first line, {"generation": n} of the snapshot it continues
+#   {"kind": "state", "data": {...}}        -> appended to state["states"]
+#   {"kind": "order", "data": {...}}        -> appended to state["orders"]
+#   {"kind": "series", "data": {...}}       -> added to the series table state["series"]
+#   {"kind": "checkpoint", "data": {...}}   -> every field that is not journaled on its own
+# Loading replays the journal tail after "journal_offset" on top of the snapshot.
+# A snapshot absorbs the whole journal: it is written with the next generation, then the journal is replaced
+# by an empty one of that generation (atomic renames). A journal of another generation than the snapshot
+# (a crash between both renames) was already absorbed and is ignored. Files without generation are legacy ones.
+
+JOURNALED_LISTS = {
+    "states": "state",
+    "orders": "order",
+}
+
+def get_journal_path(path):
+    """The journal written next to the snapshot `path`: "state.json" -> "state_journal.jsonl"."""
+    root, _ = os.path.splitext(path)
+    return f"{root}_journal.jsonl"
+
+def get_checkpoint_fields(state):
+    return {k: v for k, v in state.items() if k not in JOURNALED_LISTS and k not in ("series", "journal_offset", "journal_generation")}
+
+def get_journal_size(journal_path=TRADING_JOURNAL_FILE):
+    return os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+
+def get_journal_generation(journal_path=TRADING_JOURNAL_FILE):
+    """Generation of the journal header, None for a missing, empty or legacy journal."""
+    if not os.path.exists(journal_path):
+        return None
+    with open(journal_path, "rb") as f:
+        line = f.readline()
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record["data"]["generation"] if record.get("kind") == "journal" else None
+
+def get_journal_header(generation):
+    return json.dumps({"kind": "journal", "data": {"generation": generation}}, separators=(",", ":")) + "\n"
+
+def apply_journal_record(state, record):
+    kind = record["kind"]
+    if kind == "journal":
+        return
+    if kind == "checkpoint":
+        state.update(record["data"])
+        return
+    if kind == "series":
+        state.setdefault("series", {})[record["data"]["id"]] = record["data"]["values"]
+        return
+    for key, record_kind in JOURNALED_LISTS.items():
+        if kind == record_kind:
+            state.setdefault(key, []).append(record["data"])
+            return
+    logging.warning(f"⚠️ Unknown journal record kind '{kind}', ignoring.")
+
+def read_journal(journal_path, offset):
+    """
+    Yields (record, end offset) for every complete record after `offset`.
+    A torn last line (crash in the middle of an append) is not yielded.
+    """
+    with open(journal_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                logging.warning("⚠️ Ignoring incomplete record at the end of the state journal.")
+                return
+            try:
+                yield json.loads(line), offset
+            except ValueError:
+                logging.warning("⚠️ Ignoring corrupted record in the state journal.")
+
+def repair_journal(journal_path=TRADING_JOURNAL_FILE):
+    """Cuts a torn last line so the next append starts on a fresh line."""
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        position = size
+        while position > 0:
+            chunk_start = max(0, position - 4096)
+            f.seek(chunk_start)
+            newline = f.read(position - chunk_start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(chunk_start + newline + 1)
+                return
+            position = chunk_start
+        f.truncate(0)
+
+def load_state_file(path=TRADING_STATE_FILE, journal_path=TRADING_JOURNAL_FILE):
+    """
+    Returns the persisted state (last snapshot plus journal tail), or None if nothing was saved yet.
+    Its "journal_generation" is for StateJournal.attach().
+    """
+    loaded_state = None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            loaded_state = json.load(f)
+
+    if os.path.exists(journal_path):
+        generation = get_journal_generation(journal_path)
+        if loaded_state is None:
+            loaded_state = {"journal_generation": generation}
+        offset = loaded_state.pop("journal_offset", 0)
+        if generation == loaded_state.get("journal_generation"):
+            for record, _ in read_journal(journal_path, offset):
+                apply_journal_record(loaded_state, record)
+    elif loaded_state is not None:
+        loaded_state.pop("journal_offset", None)
+    return loaded_state
+
+def get_file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class StateFileCache:
+    """
+    Keeps the loaded state in memory for readers (the dashboard) and only re-reads what changed:
+    the snapshot is re-parsed when its mtime or size changes, otherwise only the records appended to the
+    journal since the last refresh are parsed. `version` is bumped whenever the state changed.
+    Every version is a new dict, a state returned by refresh() is never changed afterwards (it is shared by
+    readers that may still be rendering it).
+    """
+    # A journal of another generation than the snapshot is not read (see the file format above)
+    def __init__(self, path=TRADING_STATE_FILE, journal_path=TRADING_JOURNAL_FILE):
+        self.path = path
+        self.journal_path = journal_path
+        self.state = None
+        self.version = 0
+        self.snapshot_signature = None
+        self.journal_signature = None
+        self.journal_offset = 0
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            snapshot_signature = get_file_signature(self.path)
+            journal_signature = get_file_signature(self.journal_path)
+
+            if snapshot_signature != self.snapshot_signature or self.state is None:
+                self.reload(snapshot_signature)
+            elif journal_signature != self.journal_signature:
+                if (journal_signature is None or journal_signature[1] < self.journal_offset
+                        or get_journal_generation(self.journal_path) != self.generation):
+                    self.reload(snapshot_signature)  # Journal was replaced, start over
+                else:
+                    self.read_journal_tail()
+                    self.version += 1
+            self.journal_signature = journal_signature
+            return self.state
+
+    def reload(self, snapshot_signature):
+        self.state = None
+        self.journal_offset = 0
+        self.generation = get_journal_generation(self.journal_path)
+        if snapshot_signature is not None:
+            with open(self.path, "r") as f:
+                self.state = json.load(f)
+            self.journal_offset = self.state.pop("journal_offset", 0)
+            self.generation = self.state.pop("journal_generation", None)
+        self.snapshot_signature = snapshot_signature
+        self.read_journal_tail()
+        self.version += 1
+
+    def read_journal_tail(self):
+        if not os.path.exists(self.journal_path) or get_journal_generation(self.journal_path) != self.generation:
+            return
+        # Copy on write: the lists and the series table the records add to are copied, the records are shared
+        state = dict(self.state or {})
+        for key in list(JOURNALED_LISTS) + ["series"]:
+            if key in state:
+                state[key] = state[key].copy()
+        for record, offset in read_journal(self.journal_path, self.journal_offset):
+            apply_journal_record(state, record)
+            self.journal_offset = offset
+        if state or self.state is not None:
+            self.state = state
+
+class StateJournal:
+    """
+    Persists the bot state with O(1) work per save: records added to the journaled lists since the last save
+    are appended to the journal, the small mutable fields are checkpointed every `checkpoint_interval` saves
+    (and whenever an order was recorded). A full snapshot is only written every `snapshot_interval` saves,
+    the journal it absorbed is then replaced by an empty one, so the history is on disk once.
+    """
+    def __init__(self, path=TRADING_STATE_FILE, journal_path=TRADING_JOURNAL_FILE):
+        self.path = path
+        self.journal_path = journal_path
+        self.generation = None
+        self.written = {key: 0 for key in JOURNALED_LISTS}
+        self.written_series = set()
+        self.saves_since_checkpoint = 0
+        self.saves_since_snapshot = 0
+
+    def attach(self, state):
+        """Marks everything currently in `state` as persisted (call after loading)."""
+        self.generation = state.pop("journal_generation", None)
+        if os.path.exists(self.journal_path) and get_journal_generation(self.journal_path) != self.generation:
+            self.rotate_journal()  # Already absorbed by the snapshot, the bot stopped before replacing it
+        repair_journal(self.journal_path)
+        for key in JOURNALED_LISTS:
+            self.written[key] = len(state.get(key, []))
+        self.written_series = set(state.get("series", {}))
+
+    def append(self, state, checkpoint_interval=6, snapshot_interval=0):
+        lines = []
+        # Series first, the states appended below may reference them
+        for series_id, values in state.get("series", {}).items():
+            if series_id not in self.written_series:
+                lines.append(json.dumps({"kind": "series", "data": {"id": series_id, "values": values}}, separators=(",", ":")))
+        for key, kind in JOURNALED_LISTS.items():
+            records = state.get(key, [])
+            for record in records[self.written[key]:]:
+                lines.append(json.dumps({"kind": kind, "data": record}, separators=(",", ":")))
+        new_orders = len(state.get("orders", [])) - self.written["orders"]
+
+        self.saves_since_checkpoint += 1
+        self.saves_since_snapshot += 1
+        if snapshot_interval > 0 and self.saves_since_snapshot >= snapshot_interval:
+            self.write_snapshot(state)
+            return
+
+        if new_orders > 0 or self.saves_since_checkpoint >= checkpoint_interval:
+            lines.append(json.dumps({"kind": "checkpoint", "data": get_checkpoint_fields(state)}, separators=(",", ":")))
+            self.saves_since_checkpoint = 0
+
+        if lines:
+            header = "" if os.path.exists(self.journal_path) else get_journal_header(self.generation)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(header + "\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        for key in JOURNALED_LISTS:
+            self.written[key] = len(state.get(key, []))
+        self.written_series = set(state.get("series", {}))
+
+    def rotate_journal(self):
+        """Atomically replaces the journal with an empty one of the current generation."""
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(get_journal_header(self.generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def write_snapshot(self, state):
+        """Atomically replaces the snapshot with the full state, the journal written so far is absorbed and rotated."""
+        generation = (self.generation or 0) + 1
+        snapshot = dict(state)
+        snapshot["journal_offset"] = 0
+        snapshot["journal_generation"] = generation
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.generation = generation
+        if os.path.exists(self.journal_path):
+            self.rotate_journal()
+
+        for key in JOURNALED_LISTS:
+            self.written[key] = len(state.get(key, []))
+        self.written_series = set(state.get("series", {}))
+        self.saves_since_checkpoint = 0
+        self.saves_since_snapshot = 0
+
+# =======================================================
+# Series table
+# =======================================================
+
+# Long series inside a market state (price_history, dxy_history) barely change between cycles.
+# Recorded states store them once in state["series"] and keep only a reference per state:
+#   "price_history": {"series": <id>, "patch": [[index, value], ...]}
+# where "patch" lists the positions that differ from the referenced series.
+# States recorded before this (plain lists) are left untouched and still load.
+
+SERIES_FIELDS = ("price_history", "dxy_history")
+MAX_SERIES_PATCH_RATIO = 0.1
+
+def get_series_id(values):
+    return hashlib.sha1(json.dumps(values, separators=(",", ":")).encode()).hexdigest()[:16]
+
+def compact_series(values, series_table, base_id=None):
+    base = series_table.get(base_id) if base_id is not None else None
+    if base is not None and len(base) == len(values):
+        patch = [[i, v] for i, (b, v) in enumerate(zip(base, values)) if b != v]
+        if len(patch) <= len(values) * MAX_SERIES_PATCH_RATIO:
+            return {"series": base_id, "patch": patch}
+
+    series_id = get_series_id(values)
+    series_table.setdefault(series_id, list(values))
+    return {"series": series_id, "patch": []}
+
+def expand_series(value, series_table):
+    if not isinstance(value, dict) or "series" not in value:
+        return value  # Legacy plain list (or unavailable data)
+    values = list(series_table[value["series"]])
+    for i, v in value["patch"]:
+        values[i] = v
+    return values
+
+def compact_market_state(market_state, state):
+    """
+    Returns a copy of `market_state` whose long series are stored in state["series"].
+    Each series is patched against the one referenced by the previously recorded state when possible.
+    """
+    series_table = state.setdefault("series", {})
+    previous = state["states"][-1].get("market_state", {}) if state.get("states") else {}
+    compacted = dict(market_state)
+    for field in SERIES_FIELDS:
+        values = market_state.get(field)
+        if not isinstance(values, list):
+            continue
+        previous_ref = previous.get(field)
+        base_id = previous_ref["series"] if isinstance(previous_ref, dict) else None
+        compacted[field] = compact_series(values, series_table, base_id)
+    return compacted
+
+def expand_market_state(market_state, state):
+    """Reconstructs the full market state of a recorded state (both compacted and legacy entries)."""
+    series_table = state.get("series", {})
+    expanded = dict(market_state)
+    for field in SERIES_FIELDS:
+        if field in expanded:
+            expanded[field] = expand_series(expanded[field], series_table)
+    return expanded
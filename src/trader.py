@@ -1,10 +1,15 @@
 from trading_api import *
 from chatbot_api import *
 from trading_signal import *
+from state_store import *
+from history_db import *
+from lot_book import *
 import json
 import os
 import csv
 import statistics
+import threading
+import time
 from enum import Enum
 
 # =======================================================
@@ -35,121 +40,398 @@ state = {
     "orders": [],
     "states": [],
     "trailing_high": 0.0,
-    "lots": []  # Each lot: {"quantity": float, "price": float, "value": float}
+    "lots": [],  # Each lot: {"quantity": float, "price": float, "value": float, "trailing_high": float}
+    "sell_remainder": {"quantity": 0.0, "value": 0.0},  # Left over by the quantity step of filled sells
+    "pending_orders": {}  # Order id -> {"side", "quantity", "expected_price", "lots", "remainder"} until final
 }
 
+# The open lots while trading, state["lots"] is written from it on every save
+lot_book = LotBook()
+
 # =======================================================
 # Sell lots
 # =======================================================
 
-def sell_lots(current_price, signal_analysis):
-    logging.info("\t📊 Evaluating sell decision...")
-
-    # --- 
-    # -- Check if we can place a sell order ---
-    # ---
+# Guards every change to the lots, orders and persisted state: the signal loop (update_trades) and the
+# risk loop (check_risk, on its own thread) both sell lots.
+state_lock = threading.RLock()
 
-    if get_current_investment() <= config["MIN_TRADE_QUANTITY_LIQUID"]:
+def can_sell_lots(lot_count=None, current_price=None):
+    """
+    `lot_count`: the open lots, when some were already taken out of the lot book (default: the lot book size).
+    `current_price`: the price to value the investment at (default: the account snapshot's).
+    """
+    if get_current_investment(current_price) <= config["MIN_TRADE_QUANTITY_LIQUID"]:
         logging.info("\t\t⚠️ Not enough investment to sell. Skipping sell.")
         return False
-    lots = state["lots"]
-    if not lots:
+    if not (len(lot_book) if lot_count is None else lot_count):
         logging.info("\t\t⚠️ No invested lots. Skipping sell.")
         return False
     if state["paid_for_investment"] == 0:
         logging.info("\t\t⚠️ No paid for investment. Skipping sell.")
         return False
+    return True
 
-    # ---
-    # -- Calculate optimal stop loss and take profit thresholds for current market conditions ---
-    # ---
-
+def get_sell_thresholds(signal_analysis, verbose=True):
+    """Trailing stop-loss and take-profit percentages, tightened on a confirmed bearish signal and widened on a bullish one."""
     trailing_stop_pct = config["TRAILING_STOP_LOSS_PCT"]
     take_profit_pct = config["TAKE_PROFIT_PCT"]
 
     if signal_analysis["sell_signal"] and signal_analysis["sell_confirmation"]:
-        logging.info(f"\t\t🔴 Bearish signal detected. Adjusting sell thresholds. Trailing stop loss slip is {config['TRAILING_STOP_LOSS_SLIP']:.2%}, Take profit slip is {config['TAKE_PROFIT_SPLIP']:.2%}")
+        if verbose:
+            logging.info(f"\t\t🔴 Bearish signal detected. Adjusting sell thresholds. Trailing stop loss slip is {config['TRAILING_STOP_LOSS_SLIP']:.2%}, Take profit slip is {config['TAKE_PROFIT_SPLIP']:.2%}")
         trailing_stop_pct = max(trailing_stop_pct - config["TRAILING_STOP_LOSS_SLIP"], config["TRAILING_STOP_LOSS_SLIP"])
         take_profit_pct = max(take_profit_pct - config["TAKE_PROFIT_SPLIP"], config["TAKE_PROFIT_SPLIP"])
     
     elif signal_analysis["buy_signal"] and signal_analysis["buy_confirmation"]:
-        logging.info(f"\t\t🟢 Bullish signal detected. Adjusting sell thresholds. Trailing stop loss slip is {config['TRAILING_STOP_LOSS_SLIP']:.2%}, Take profit slip is {config['TAKE_PROFIT_SPLIP']:.2%}")
+        if verbose:
+            logging.info(f"\t\t🟢 Bullish signal detected. Adjusting sell thresholds. Trailing stop loss slip is {config['TRAILING_STOP_LOSS_SLIP']:.2%}, Take profit slip is {config['TAKE_PROFIT_SPLIP']:.2%}")
         trailing_stop_pct = trailing_stop_pct + config["TRAILING_STOP_LOSS_SLIP"]
         take_profit_pct = take_profit_pct + config["TAKE_PROFIT_SPLIP"]
+    return trailing_stop_pct, take_profit_pct
+
+def get_lot_trigger_info(lot, reason, current_price, trailing_stop_pct, take_profit_pct):
+    realized_pct = (current_price - lot.price) / lot.price
+    trailing_high = lot.trailing_high
+    trailing_drawdown = (current_price - trailing_high) / trailing_high
+
+    # Trailing stop-loss: sell if price drops from trailing high by trailing_stop_pct
+    if reason == "trailing_stop":
+        logging.info("\t\t🔴 Trailing stop-loss triggered for lot.")
+        return f"Trailing stop-loss triggered: Trailing drawdown is {trailing_drawdown:.2%}, realized percentage is {realized_pct:.2%}, trailing stop percentage is {trailing_stop_pct:.2%}"
+
+    # Take profit: sell if price increases from lot price by take_profit_pct
+    logging.info("\t\t🟢 Take-profit triggered for lot.")
+    return f"Take-profit triggered: Realized percentage is {realized_pct:.2%}, Take profit is {take_profit_pct:.2%}"
+
+# Lots whose sell was refused or failed are retried by the risk loop with an exponential backoff:
+# lot id -> (retry time on the trading clock, failed attempts)
+lot_retries = {}
+
+def postpone_lots(lots):
+    base = config.get("RISK_RETRY_BACKOFF_SECONDS", 60)
+    for lot in lots:
+        _, failures = lot_retries.get(lot.id, (0.0, 0))
+        delay = min(base * 2 ** failures, config.get("RISK_RETRY_MAX_BACKOFF_SECONDS", 3600))
+        lot_retries[lot.id] = (clock.time() + delay, failures + 1)
+
+def is_lot_waiting(lot, now):
+    return lot.id in lot_retries and lot_retries[lot.id][0] > now
+
+def get_triggered_lots(current_price, trailing_stop_pct, take_profit_pct, skip_waiting=False):
+    """
+    Raises the trailing highs to the price, takes the lots to sell out of the lot book
+    and returns them as [(lot, sell reason)]. Lots that are not sold must be restored (restore_lots).
+    With `skip_waiting`, lots waiting for a retry (postpone_lots) stay in the lot book.
+    """
+    triggered = lot_book.pop_triggered(current_price, trailing_stop_pct, take_profit_pct)
+    if skip_waiting:
+        now = clock.time()
+        restore_lots(lot for lot, _ in triggered if is_lot_waiting(lot, now))
+        triggered = [(lot, reason) for lot, reason in triggered if not is_lot_waiting(lot, now)]
+    return [
+        (lot, get_lot_trigger_info(lot, reason, current_price, trailing_stop_pct, take_profit_pct))
+        for lot, reason in triggered
+    ]
 
-    # ---
-    # -- Update and maybe sell each lot ---
-    # ---
+def restore_lots(lots):
+    for lot in lots:
+        lot_book.add(lot, lot.trailing_high)
+
+def allocate_fill(lots, filled_quantity):
+    """
+    Splits the filled quantity of an order over its lots in the order they were opened: the sold quantity
+    of every lot, the lots after the last (partly) sold one get 0.
+    """
+    quantities = []
+    remaining = filled_quantity
+    for lot in lots:
+        quantity = min(lot.quantity, remaining)
+        quantities.append(quantity)
+        remaining -= quantity
+        if remaining < filled_quantity * 1e-12:  # Float residue of the subtractions
+            remaining = 0.0
+    return quantities
+
+# Placed orders are kept in state["pending_orders"] until they are final, with what their callback needs (sold lots,
+# carried remainder, expected price): the lots are saved with the order, and after a restart the order is
+# tracked again (reconcile_pending_orders) instead of being lost with its lots.
+
+def track_pending_order(order_id, pending):
+    with state_lock:
+        pending["order_id"] = order_id
+        state["pending_orders"][order_id] = pending
+        save_state(checkpoint=True)
+
+def untrack_pending_order(pending):
+    """True if the order was placed, so its pending entry was removed from the state."""
+    return state["pending_orders"].pop(pending.get("order_id"), None) is not None
+
+def record_lot_sells(triggered, quantities, fill, expected_price):
+    for (lot, info), quantity in zip(triggered, quantities):
+        if quantity <= 0:
+            continue
+        share = quantity / fill["quantity"]
+        state["orders"].append({
+            "type": "sell",
+            "timestamp": clock.time(),
+            "price": fill["price"],
+            "quantity": quantity,
+            "value": fill["value"] * share,
+            "fee": fill["fee"] * share,
+            "latency": fill["latency"],
+            "order_id": fill["order_id"],
+            "expected_price": expected_price,
+            "info": info,
+            "batch_size": len(triggered)
+        })
+    state["last_trade_time"] = clock.time()
+
+# A filled sell order is rounded down to the instrument's quantity step: the quantity it left unsold is too small
+# to be sold on its own, so it is carried forward (with its share of the paid value) and added to the next sell order.
+
+def take_sell_remainder():
+    remainder = state["sell_remainder"]
+    state["sell_remainder"] = {"quantity": 0.0, "value": 0.0}
+    return remainder
+
+def carry_sell_remainder(quantity, value):
+    state["sell_remainder"] = {
+        "quantity": state["sell_remainder"]["quantity"] + quantity,
+        "value": state["sell_remainder"]["value"] + value,
+    }
 
-    any_sold = False
-    for lot in lots[:]:
-        lot["trailing_high"] = max(current_price, lot["trailing_high"])
-
-        realized_pct = (current_price - lot["price"]) / lot["price"]
-        trailing_drawdown = (current_price - lot["trailing_high"]) / lot["trailing_high"]
-        current_sold = False
-
-        info = "Unspecified"
-
-        # Trailing stop-loss: sell if price drops from trailing high by trailing_stop_pct
-        if trailing_drawdown < -trailing_stop_pct:
-            logging.info("\t\t🔴 Trailing stop-loss triggered for lot.")
-            info = f"Trailing stop-loss triggered: Trailing drawdown is {trailing_drawdown:.2%}, realized percentage is {realized_pct:.2%}, trailing stop percentage is {trailing_stop_pct:.2%}"
-            current_sold = True
-        
-        # Take profit: sell if price increases from lot price by take_profit_pct
-        elif realized_pct > take_profit_pct:
-            logging.info("\t\t🟢 Take-profit triggered for lot.")
-            info = f"Take-profit triggered: Realized percentage is {realized_pct:.2%}, Take profit is {take_profit_pct:.2%}"
-            current_sold = True
-        
-        # Sell the lot if conditions are met
-        if current_sold and sell(lot["quantity"]):
-            any_sold = True
-            state["orders"].append({
-                "type": "sell",
-                "timestamp": time.time(),
-                "price": current_price,
-                "quantity": lot["quantity"],
-                "value": lot["quantity"] * current_price,
-                "info": info
-            })
-            state["last_trade_time"] = time.time()
-            lots.remove(lot)
-    
-    if any_sold:
-        state["paid_for_investment"] = sum(l["value"] for l in lots)
+def on_sell_final(triggered, remainder, fill, expected_price, pending):
+    """
+    Order callback of a lot sell: records the fill, or puts the lots (and the carried remainder) back
+    if nothing was sold (the risk loop retries the lots after a backoff, saved only if the order was placed).
+    The fill goes to the carried remainder first, then to the lots in the order they were opened.
+    """
+    with state_lock:
+        lots = [lot for lot, _ in triggered]
+        placed = untrack_pending_order(pending)
+        if fill is None:
+            restore_lots(lots)
+            postpone_lots(lots)
+            carry_sell_remainder(remainder["quantity"], remainder["value"])
+            if placed:
+                save_state(checkpoint=True)
+            return
+        remainder_sold = min(remainder["quantity"], fill["quantity"])
+        quantities = allocate_fill(lots, fill["quantity"] - remainder_sold)
+        record_lot_sells(triggered, quantities, fill, expected_price)
+        if remainder_sold > 0:
+            record_lot_sells([(None, "Remainder of earlier sells")], [remainder_sold], fill, expected_price)
+        if remainder_sold < remainder["quantity"]:
+            unsold_share = 1.0 - remainder_sold / remainder["quantity"]
+            carry_sell_remainder(remainder["quantity"] - remainder_sold, remainder["value"] * unsold_share)
+
+        # A filled order only left the rounding remainder unsold, which is carried forward.
+        # A partial fill leaves part of the lots unsold: they stay open, reduced, with their price and trailing high.
+        unsold = []
+        for lot, quantity in zip(lots, quantities):
+            if quantity < lot.quantity:
+                unsold_value = lot.value * (lot.quantity - quantity) / lot.quantity
+                if fill["status"] == "Filled":
+                    carry_sell_remainder(lot.quantity - quantity, unsold_value)
+                    lot_retries.pop(lot.id, None)
+                    continue
+                lot.value = unsold_value
+                lot.quantity -= quantity
+                unsold.append(lot)
+            else:
+                lot_retries.pop(lot.id, None)
+        if unsold:
+            logging.info(f"\t\t↩️ {sum(lot.quantity for lot in unsold)} of {len(unsold)} lot(s) not sold ({fill['status']}), kept open.")
+            restore_lots(unsold)
+        state["paid_for_investment"] = lot_book.total_value + state["sell_remainder"]["value"]
+        save_state()
+
+def sell_triggered_lots(triggered, current_price):
+    """
+    Submits the sell orders of the triggered lots. SELL_EXECUTION_MODE "net" (default) nets them into one
+    market order, whose fill is allocated back to every lot in the order history; "per_lot" places one order per lot.
+    The carried remainder of earlier sells is added to the (first) order.
+    """
+    if not triggered:
+        return False
+
+    remainder = take_sell_remainder()
+    if config.get("SELL_EXECUTION_MODE", "net") == "net" and len(triggered) > 1:
+        total_quantity = sum(lot.quantity for lot, _ in triggered) + remainder["quantity"]
+        logging.info(f"\t\t📦 Netting {len(triggered)} triggered lots into one sell order of {total_quantity}.")
+        sell_lot_order(triggered, remainder, total_quantity, current_price)
     else:
-        logging.info("\t\t⚠️ No sell conditions met for any lot. Skipping sell.")
-    return any_sold
+        no_remainder = {"quantity": 0.0, "value": 0.0}
+        for i, hit in enumerate(triggered):
+            carried = remainder if i == 0 else no_remainder
+            sell_lot_order([hit], carried, hit[0].quantity + carried["quantity"], current_price)
+    return True
+
+def sell_lot_order(triggered, remainder, quantity, current_price):
+    pending = {
+        "side": "Sell",
+        "quantity": quantity,
+        "expected_price": current_price,
+        "lots": [dict(lot.to_dict(), info=info) for lot, info in triggered],
+        "remainder": remainder,
+    }
+    sell(
+        quantity,
+        lambda fill: on_sell_final(triggered, remainder, fill, current_price, pending),
+        current_price,
+        on_placed=lambda order_id: track_pending_order(order_id, pending),
+    )
+
+def sell_lots(current_price, signal_analysis):
+    logging.info("\t📊 Evaluating sell decision...")
+
+    with state_lock:
+        if not can_sell_lots():
+            return False
+
+        # Optimal stop loss and take profit thresholds for current market conditions
+        trailing_stop_pct, take_profit_pct = get_sell_thresholds(signal_analysis)
+
+        triggered = get_triggered_lots(current_price, trailing_stop_pct, take_profit_pct)
+        any_sold = sell_triggered_lots(triggered, current_price)
+        if not any_sold:
+            logging.info("\t\t⚠️ No sell conditions met for any lot. Skipping sell.")
+        return any_sold
 
 # =======================================================
-# Buy lots
+# Risk loop
 # =======================================================
 
-def buy_lot(quantity, current_price):
-    if buy(quantity * current_price):
+def check_risk(current_price):
+    """
+    Fast path of sell_lots() for a single price update: trailing highs, stop-loss and take-profit only,
+    with the thresholds of the last signal analysis. Sold lots are persisted once their order is final.
+    """
+    if current_price is None:
         return False
+    with state_lock:
+        if not lot_book or not state["states"]:
+            return False
+        trailing_stop_pct, take_profit_pct = get_sell_thresholds(state["states"][-1]["signal_analysis"], verbose=False)
+        if not lot_book.has_triggered(current_price, trailing_stop_pct, take_profit_pct):
+            return False
+
+        # Lots whose last sell attempt failed wait for their retry
+        triggered = get_triggered_lots(current_price, trailing_stop_pct, take_profit_pct, skip_waiting=True)
+        if not triggered:
+            return False
+        logging.info(f"⚡ Risk check at {current_price:.2f}: {len(triggered)} lot(s) triggered between signal cycles.")
+        if not can_sell_lots(len(lot_book) + len(triggered), current_price):
+            lots = [lot for lot, _ in triggered]
+            restore_lots(lots)
+            postpone_lots(lots)
+            return False
+        return sell_triggered_lots(triggered, current_price)
+
+class RiskLoop:
+    """
+    Runs check_risk() on every price update between two signal cycles, on a background thread.
+    RISK_PRICE_FEED "poll" (default) polls the ticker every RISK_LOOP_INTERVAL_SECONDS,
+    "websocket" subscribes to the Bybit ticker stream. Both watch the index price, like the signal cycle.
+    """
+    def __init__(self, symbol, interval, feed="poll"):
+        self.symbol = symbol
+        self.interval = interval
+        self.feed = feed
+        self.last_price = None
+        self.last_update = None
+        self.websocket = None
+        self.thread = threading.Thread(target=self.run, name="risk_loop", daemon=True)
+
+    def start(self):
+        if self.feed == "websocket":
+            from pybit.unified_trading import WebSocket
+            self.websocket = WebSocket(testnet=True, channel_type="linear")
+            self.websocket.ticker_stream(symbol=self.symbol, callback=self.on_ticker_message)
+        else:
+            self.thread.start()
+        return self
+
+    def on_ticker_message(self, message):
+        # Ticker deltas only carry the fields that changed
+        price = message.get("data", {}).get("indexPrice")
+        if price is not None:
+            self.on_price(float(price))
+
+    def on_price(self, price):
+        self.last_price = price
+        self.last_update = time.time()
+        try:
+            check_risk(price)
+        except Exception as e:
+            logging.error(f"❌ Error in risk check: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            price = get_price_for_symbol(self.symbol)  # None (already logged) when the ticker request failed
+            if price is not None:
+                self.on_price(price)
+
+def wait_for_next_cycle(seconds):
+    """
+    Waits for the next signal cycle. The risk loop thread keeps watching the price meanwhile;
+    a simulated run (no real time passes) steps its clock and runs the risk checks inline instead.
+    """
+    if not is_simulated_exchange() or not config.get("RISK_LOOP_ENABLED", True):
+        clock.sleep(seconds)
+        return
+    step = config.get("SIMULATED_EXCHANGE", {}).get("RISK_STEP_SECONDS", 900)
+    remaining = seconds
+    while remaining > 0:
+        clock.sleep(min(step, remaining))
+        remaining -= step
+        check_risk(get_price_for_symbol(config["TRADING_SYMBOL"]))
 
-    state["orders"].append({
-        "type": "buy",
-        "timestamp": time.time(),
-        "price": current_price,
-        "quantity": quantity,
-        "value": current_price * quantity,
-        "info": "Bullish signal buy"
-    })
-
-    state["lots"].append({
-        "quantity": quantity, 
-        "price": current_price, 
-        "value": quantity * current_price,
-        "trailing_high": current_price
-    })
-
-    state["paid_for_investment"] = sum(l["value"] for l in state["lots"])
-    state["last_trade_time"] = time.time()
-    return True
+# =======================================================
+# Buy lots
+# =======================================================
+
+def buy_lot(quantity, current_price):
+    """
+    Submits the buy order of a lot, the lot is opened once the order is filled (on_buy_final).
+    False if the order was rejected before being submitted.
+    """
+    pending = {"side": "Buy", "quantity": quantity * current_price, "expected_price": current_price}
+    return buy(
+        quantity * current_price,
+        lambda fill: on_buy_final(fill, current_price, pending),
+        on_placed=lambda order_id: track_pending_order(order_id, pending),
+    )
+
+def on_buy_final(fill, expected_price, pending):
+    """Order callback of a lot buy: the lot is opened with the executed quantity (minus the fee) and price."""
+    with state_lock:
+        placed = untrack_pending_order(pending)
+        if fill is None:
+            if placed:
+                save_state(checkpoint=True)
+            return
+        state["orders"].append({
+            "type": "buy",
+            "timestamp": clock.time(),
+            "price": fill["price"],
+            "quantity": fill["quantity"],
+            "value": fill["value"],
+            "fee": fill["fee"],
+            "latency": fill["latency"],
+            "order_id": fill["order_id"],
+            "expected_price": expected_price,
+            "info": "Bullish signal buy"
+        })
+
+        # Spot buy fees are paid in the bought coin
+        lot_book.add(Lot(fill["quantity"] - fill["fee"], fill["price"], fill["value"]))
+
+        state["paid_for_investment"] = lot_book.total_value + state["sell_remainder"]["value"]
+        state["last_trade_time"] = clock.time()
+        save_state()
 
 def buy_lots(current_price, signal_analysis):
     logging.info("\t📊 Evaluating buy decision...")
@@ -217,6 +499,9 @@ def get_signal_analysis(market_state, responses):
 def update_trades():
     logging.info("📊 Evaluating trade decision...")
 
+    # Balances are served from one account snapshot per cycle
+    invalidate_account_snapshot()
+
     # ---
     # -- Market State --
     # ---
@@ -253,38 +538,82 @@ def update_trades():
     # --- Logging State ---
     # ---
 
-    state["states"].append({
-        "timestamp": time.time(),
-        "price": market_state["current_price"],
-        "liquidity": get_current_liquidity(),
-        "investment": get_current_investment(),
-        "market_state": market_state,
-        "responses": responses,
-        "quantity": get_balance_for_symbol(config["INVESTED_SYMBOL"]),
-        "paid_for_investment": state["paid_for_investment"],
-        "lot_count": len(state["lots"]),
-        "signal_analysis": signal_analysis,
-    })
+    with state_lock:
+        state_entry = {
+            "timestamp": clock.time(),
+            "price": market_state["current_price"],
+            "liquidity": get_current_liquidity(),
+            "investment": get_current_investment(),
+            "market_state": compact_market_state(market_state, state),
+            "responses": responses,
+            "quantity": get_balance_for_symbol(config["INVESTED_SYMBOL"]),
+            "paid_for_investment": state["paid_for_investment"],
+            "lot_count": len(lot_book),
+            "signal_analysis": signal_analysis,
+        }
+        state["states"].append(state_entry)
+    record_state(state_entry, history_file)
 
 # =======================================================
 # Main Execution
 # =======================================================
 
+# A simulated run never touches the files of the live bot
+if is_simulated_exchange():
+    simulated_config = config.get("SIMULATED_EXCHANGE", {})
+    state_file = simulated_config.get("STATE_FILE", "sim_state.json")
+    journal_file = simulated_config.get("JOURNAL_FILE", "sim_state_journal.jsonl")
+    history_file = simulated_config.get("HISTORY_DB_FILE", "sim_history.db")
+else:
+    state_file, journal_file, history_file = TRADING_STATE_FILE, TRADING_JOURNAL_FILE, HISTORY_DB_FILE
+
+state_journal = StateJournal(state_file, journal_file)
+
+def reconcile_pending_orders():
+    """Tracks the orders that were still pending when the bot stopped again: their fills are recorded once final."""
+    for order_id, pending in list(state["pending_orders"].items()):
+        if pending["side"] == "Sell":
+            triggered = []
+            for lot in pending["lots"]:
+                # Added and removed again: an id and a trailing high, but out of the lot book like any lot being sold
+                sold_lot = lot_book.add(Lot(lot["quantity"], lot["price"], lot["value"]), lot["trailing_high"])
+                lot_book.remove(sold_lot)
+                triggered.append((sold_lot, lot["info"]))
+            callback = lambda fill, triggered=triggered, pending=pending: on_sell_final(
+                triggered, pending["remainder"], fill, pending["expected_price"], pending)
+        else:
+            callback = lambda fill, pending=pending: on_buy_final(fill, pending["expected_price"], pending)
+        track_order(order_id, pending["side"], pending["quantity"], callback)
+
 def load_state():
-    if os.path.exists(TRADING_STATE_FILE):
-        with open(TRADING_STATE_FILE, "r") as f:
-            loaded_state = json.load(f)
-            state.update(loaded_state)
+    loaded_state = load_state_file(state_file, journal_file)
+    if loaded_state is not None:
+        state.update(loaded_state)
+    lot_book.load(state["lots"])
+    state_journal.attach(state)
+    reconcile_pending_orders()
+    if not os.path.exists(history_file) and state["states"]:
+        backfill_history(state["states"], history_file)
     if not state["initialized"]:
         state["initialized"] = True
         state["last_price"] = get_price_for_symbol(config["TRADING_SYMBOL"])
         state["start_balance"] = get_current_balance()
-        state["start_time"] = time.time()
+        state["start_time"] = clock.time()
         state["start_price"] = state["last_price"]
 
-def save_state():
-    with open(TRADING_STATE_FILE, "w") as f:
-        json.dump(state, f, indent=4)
+def save_state(snapshot=False, checkpoint=False):
+    """`checkpoint`: the small fields changed without a new order (pending orders), so journal mode must write them now."""
+    with state_lock:
+        state["lots"] = lot_book.to_dicts()
+        # In journal mode only the records added since the last save are written
+        if config.get("STATE_JOURNAL_MODE", False) and not snapshot:
+            state_journal.append(
+                state,
+                checkpoint_interval=1 if checkpoint else config.get("STATE_CHECKPOINT_INTERVAL", 6),
+                snapshot_interval=config.get("STATE_SNAPSHOT_INTERVAL", 42)
+            )
+        else:
+            state_journal.write_snapshot(state)
 
 def format_duration(seconds):
     if seconds < 60:
@@ -296,7 +625,18 @@ def format_duration(seconds):
 
 if __name__ == "__main__":
     try:
+        if is_simulated_exchange():
+            logging.info(f"🧪 Using the simulated exchange backend, state is saved to {state_file}.")
         load_state()
+        if config.get("RISK_LOOP_ENABLED", True) and not is_simulated_exchange():
+            risk_loop = RiskLoop(
+                config["TRADING_SYMBOL"],
+                config.get("RISK_LOOP_INTERVAL_SECONDS", 15),
+                config.get("RISK_PRICE_FEED", "poll")
+            ).start()
+            logging.info(f"⚡ Risk loop watching {config['TRADING_SYMBOL']} ({risk_loop.feed}) between signal cycles.")
+        if not is_simulated_exchange():
+            order_executor.start()
         while True:
             load_api_keys_config()
             load_trader_config()
@@ -304,10 +644,20 @@ if __name__ == "__main__":
 
             logging.info(f"🕒 Next trade update in {format_duration(config['TRADING_INTERVAL_SECONDS'])} ...")
             state["last_price"] = get_price_for_symbol(config["TRADING_SYMBOL"])
+            if config["VERBOSE_LOGGING"]:
+                logging.info(f"📊 Ticker cache: {get_ticker_cache_stats()}")
+                logging.info(f"📊 HTTP latency per host: {get_http_stats()}")
+                logging.info(f"📊 Orders: {get_order_stats()}")
             save_state()
 
-            time.sleep(config["TRADING_INTERVAL_SECONDS"])
+            wait_for_next_cycle(config["TRADING_INTERVAL_SECONDS"])
+            if is_replay_finished():
+                logging.info("🏁 Simulated exchange replay finished.")
+                save_state(snapshot=True)
+                break
 
     except KeyboardInterrupt:
         logging.info("👋 Bot stopped manually. Cleaning up...")
-        save_state()
\ No newline at end of file
+        if not order_executor.flush():
+            logging.warning("⚠️ Stopped with orders still pending, they are tracked again on the next start.")
+        save_state(snapshot=True)
\ No newline at end of file
@@ -2,12 +2,18 @@ from pybit.unified_trading import HTTP
 from datetime import datetime, timezone
 from pytrends.request import TrendReq
 from config import *
+from exchange import *
+from http_client import *
+from candle_store import *
+from order_executor import *
+from instrument_info import *
 from enum import Enum
+from decimal import Decimal
 import yfinance as yf
 import logging
 import functools
 import time
-import requests
+import threading
 import math
 
 import warnings
@@ -17,11 +23,24 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 # Setup Bybit Trading Session
 # =======================================================
 
-session = HTTP(
-    testnet=True,
-    api_key=api_keys["BYBIT_API_KEY"],
-    api_secret=api_keys["BYBIT_API_SECRET"]
-)
+def create_session():
+    """EXCHANGE_BACKEND "bybit" (default) talks to Bybit, "simulated" runs an in-process exchange on replayed prices."""
+    if config.get("EXCHANGE_BACKEND", "bybit") == "simulated":
+        return SimulatedExchange.from_config(config.get("SIMULATED_EXCHANGE", {}))
+    return HTTP(
+        testnet=True,
+        api_key=api_keys["BYBIT_API_KEY"],
+        api_secret=api_keys["BYBIT_API_SECRET"]
+    )
+
+session = create_session()
+clock = session.clock if isinstance(session, SimulatedExchange) else RealClock()
+
+def is_simulated_exchange():
+    return isinstance(session, SimulatedExchange)
+
+def is_replay_finished():
+    return is_simulated_exchange() and session.replay_finished()
 
 # =======================================================
 # Helper Functions
@@ -42,46 +61,85 @@ def retry_on_exception(max_retries=3, delay=2):
         return wrapper
     return decorator
 
+# =======================================================
+# Ticker cache
+# =======================================================
+
+ticker_cache = {}  # symbol -> (fetch time on the trading clock, raw ticker entry)
+ticker_cache_stats = {"hits": 0, "misses": 0}
+ticker_cache_lock = threading.Lock()
+
+def get_ticker(symbol):
+    """
+    Returns the raw linear ticker entry for `symbol` (indexPrice, price24hPcnt, ...).
+    Responses are shared between callers for TICKER_CACHE_TTL_SECONDS.
+    """
+    ttl = config.get("TICKER_CACHE_TTL_SECONDS", 10)
+    with ticker_cache_lock:
+        cached = ticker_cache.get(symbol)
+        if cached is not None and clock.time() - cached[0] < ttl:
+            ticker_cache_stats["hits"] += 1
+            return cached[1]
+        ticker_cache_stats["misses"] += 1
+
+    ticker = session.get_tickers(category="linear", symbol=symbol)['result']['list'][0]
+    with ticker_cache_lock:
+        ticker_cache[symbol] = (clock.time(), ticker)
+    return ticker
+
+def invalidate_ticker_cache(symbol=None):
+    with ticker_cache_lock:
+        if symbol is None:
+            ticker_cache.clear()
+        else:
+            ticker_cache.pop(symbol, None)
+
+def get_ticker_cache_stats():
+    with ticker_cache_lock:
+        requests_count = ticker_cache_stats["hits"] + ticker_cache_stats["misses"]
+        return {
+            "hits": ticker_cache_stats["hits"],
+            "misses": ticker_cache_stats["misses"],
+            "hit_rate": ticker_cache_stats["hits"] / requests_count if requests_count else 0.0,
+            "size": len(ticker_cache),
+        }
+
 # =======================================================
 # Price analysis functions
 # =======================================================
 
 def get_price_for_symbol(symbol):
     try:
-        price_data = session.get_tickers(category="linear", symbol=symbol)
-        return float(price_data['result']['list'][0]['indexPrice'])
+        return float(get_ticker(symbol)['indexPrice'])
     except Exception as e:
         logging.error(f"❌ Error fetching price for {symbol}: {e}")
         return None
 
 def get_volatility_for_symbol_24hr(symbol):
     try:
-        ticker = session.get_tickers(category="linear", symbol=symbol)
-        change_24h = float(ticker['result']['list'][0]['price24hPcnt']) * 100
+        change_24h = float(get_ticker(symbol)['price24hPcnt']) * 100
         return change_24h
     except Exception as e:
         logging.error(f"❌ Failed to fetch 24h change from Bybit: {e}")
         return 2.0
 
+# Simulated runs keep their candles in memory, the replay clock must not mix with stored live candles
+candle_store = CandleStore(":memory:" if is_simulated_exchange() else CANDLE_DB_FILE, session, clock)
+
 def get_price_history(symbol, limit=120, interval="D"):
     """
-    Returns a list of dicts: {"time": timestamp, "price": price}
+    Returns a list of dicts: {"time": timestamp, "price": price}, newest first
     interval: "D" (daily), "W" (weekly), "M" (monthly)
+    Served from the local candle store, only candles newer than the stored ones are requested.
     """
     try:
-        res = session.get_kline(
-            category="linear",
-            symbol=symbol,
-            interval=interval,
-            limit=limit
-        )
-        candles = res['result']['list']
+        candles = candle_store.get_recent(symbol, interval, limit)
         return [
             {
-                "time": int(k[0]) // 1000.0,  # ms to s
-                "price": float(k[4])
+                "time": t,
+                "price": price
             }
-            for k in candles
+            for t, price in zip(candles["time"][::-1].tolist(), candles["close"][::-1].tolist())
         ]
     except Exception as e:
         logging.error(f"❌ Failed to fetch price history for {symbol}: {e}")
@@ -95,7 +153,7 @@ def get_price_history(symbol, limit=120, interval="D"):
 def safe_cmc_request(url):
     headers = {"X-CMC_PRO_API_KEY": api_keys["CMC_API_KEY"]}
     try:
-        r = requests.get(url, headers=headers)
+        r = http_client.get(url, headers=headers)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -126,7 +184,7 @@ def get_cryptopanic_sentiment():
         "public": "true"
     }
     try:
-        r = requests.get("https://cryptopanic.com/api/v1/posts/", params=params, timeout=10)
+        r = http_client.get("https://cryptopanic.com/api/v1/posts/", params=params)
         r.raise_for_status()
         data = r.json()
         posts = data.get("results", [])
@@ -159,7 +217,8 @@ def get_cryptopanic_sentiment():
 
 def get_halving_info():
     url = "https://api.blockchain.info/q/getblockcount"
-    response = requests.get(url)
+    response = http_client.get(url)
+    response.raise_for_status()
     current_block = int(response.text)
 
     halving_interval = 210000
@@ -247,7 +306,7 @@ def get_bitcoin_rainbow_band():
     b = 4.02
     start_date = datetime(2009, 1, 9)
 
-    response = requests.get(url, headers=headers)
+    response = http_client.get(url, headers=headers)
     if response.status_code != 200:
         raise RuntimeError(f"Failed to fetch data: {response.status_code} - {response.text}")
 
@@ -267,66 +326,191 @@ def get_bitcoin_rainbow_band():
 # Trading account
 # =======================================================
 
+class AccountSnapshot:
+    """
+    Wallet balances and trading symbol price, fetched once and then served from memory.
+    Dropped by invalidate_account_snapshot() whenever an order is placed (or a new trading cycle starts).
+    The wallet and the price are fetched independently: if the ticker fails, the balances are kept
+    and the price is fetched again when it is needed (`price` is None until then).
+    """
+    def __init__(self):
+        balance_data = session.get_wallet_balance(accountType="UNIFIED")
+        self.balances = {
+            coin['coin']: float(coin['walletBalance'])
+            for coin in balance_data['result']['list'][0]['coin']
+        }
+        self.timestamp = clock.time()
+        self.price = None
+        self.fetch_price()
+
+    def fetch_price(self):
+        try:
+            self.price = float(get_ticker(config["TRADING_SYMBOL"])['indexPrice'])
+        except Exception as e:
+            logging.error(f"❌ Error fetching the {config['TRADING_SYMBOL']} price of the account snapshot: {e}")
+
+    def get_price(self):
+        if self.price is None:
+            self.fetch_price()
+        if self.price is None:
+            raise RuntimeError(f"No {config['TRADING_SYMBOL']} price available")
+        return self.price
+
+    def get_balance(self, symbol):
+        return self.balances.get(symbol, 0.0)
+
+    def get_liquidity(self):
+        return self.get_balance(config["LIQUIDITY_SYMBOL"])
+
+    def get_investment(self, price=None):
+        return self.get_balance(config["INVESTED_SYMBOL"]) * (self.get_price() if price is None else price)
+
+    def get_total_balance(self):
+        return self.get_investment() + self.get_liquidity()
+
+account_snapshot = None
+account_snapshot_lock = threading.Lock()
+
+def get_account_snapshot():
+    global account_snapshot
+    with account_snapshot_lock:
+        if account_snapshot is None:
+            account_snapshot = AccountSnapshot()
+        return account_snapshot
+
+def invalidate_account_snapshot():
+    global account_snapshot
+    with account_snapshot_lock:
+        account_snapshot = None
+
+class AccountRefresher:
+    """
+    Keeps a fresh AccountSnapshot on a background thread (every `interval` seconds),
+    so readers like the dashboard never block on the network. `snapshot` is None until the first fetch.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.snapshot = None
+        self.last_error = None
+        self.thread = threading.Thread(target=self.run, name="account_refresher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            try:
+                snapshot = AccountSnapshot()
+                snapshot.get_price()  # Readers need both, a snapshot without price keeps the previous one
+                self.snapshot = snapshot
+                self.last_error = None
+            except Exception as e:
+                logging.error(f"❌ Error refreshing account snapshot: {e}")
+                self.last_error = str(e)
+            time.sleep(self.interval)
+
+    def get_age(self):
+        return clock.time() - self.snapshot.timestamp if self.snapshot else None
+
 def get_current_liquidity():
     return get_balance_for_symbol(config["LIQUIDITY_SYMBOL"])
 
-def get_current_investment():
-    return get_balance_for_symbol(config["INVESTED_SYMBOL"]) * get_price_for_symbol(config["TRADING_SYMBOL"])
+def get_current_investment(price=None):
+    """`price`: values the invested coin at a fresher price than the snapshot's (e.g. a risk loop tick)."""
+    try:
+        return get_account_snapshot().get_investment(price)
+    except Exception as e:
+        logging.error(f"❌ Error fetching current investment: {e}")
+    return 0.0
 
 def get_current_balance():
     return get_current_investment() + get_current_liquidity()
 
-def round_down(number, decimals=0):
-    factor = 10 ** decimals
-    return math.floor(number * factor) / factor
+# Orders are placed and tracked until filled by the order executor (started by the trader outside of simulated runs)
+order_executor = OrderExecutor(
+    session,
+    config["TRADING_SYMBOL"],
+    poll_interval=config.get("ORDER_POLL_INTERVAL_SECONDS", 1.0),
+    fill_timeout=config.get("ORDER_FILL_TIMEOUT_SECONDS", 60.0),
+    max_backoff=config.get("ORDER_POLL_MAX_BACKOFF_SECONDS", 300.0),
+)
+
+def on_order_final(callback):
+    def wrapper(fill):
+        # Balances changed, and the cached price may be older than the order
+        invalidate_account_snapshot()
+        invalidate_ticker_cache(config["TRADING_SYMBOL"])
+        callback(fill)
+    return wrapper
+
+# A simulated exchange gets its instrument info in memory only, it must not overwrite the live one
+instrument_cache = InstrumentInfoCache(
+    session,
+    None if is_simulated_exchange() else INSTRUMENT_INFO_FILE,
+    refresh_seconds=config.get("INSTRUMENT_INFO_REFRESH_SECONDS", 86400),
+)
 
-def buy(quantity):
+def get_instrument_info(symbol=None):
     try:
-        quantity = round_down(quantity, 6)
-        order = session.place_order(
-            category="spot",
-            symbol=config["TRADING_SYMBOL"],
-            side="Buy",
-            order_type="Market",
-            qty=quantity,
-        )
-        if not order or order.get("retCode", 1) != 0:
-            error_msg = order.get("retMsg", "Unknown error") if order else "No response from API"
-            logging.error(f"❌ Buy order failed for {quantity}: {error_msg}")
-            return False
-        logging.info(f"✅ Buy order placed for {quantity}")
-        return True
+        return instrument_cache.get(symbol or config["TRADING_SYMBOL"])
     except Exception as e:
-        logging.error(f"❌ Error placing buy order for {quantity}: {e}")
+        logging.error(f"❌ Error fetching instrument info: {e}")
+        return None
+
+# Without instrument info, order sizes are rounded down to 6 decimals (as a Decimal, like the instrument steps:
+# a float could be sent in scientific notation, which the exchange rejects)
+FALLBACK_ORDER_STEP = Decimal("0.000001")
+
+def buy(quantity, callback, on_placed=None):
+    """
+    Market buy for `quantity` of the liquidity coin, callback(fill) once the order is final (see OrderExecutor).
+    The amount is rounded down to the instrument's quote step; an order the exchange would reject fails locally.
+    Returns True if the order was submitted.
+    """
+    instrument = get_instrument_info()
+    if instrument is None:
+        logging.warning("⚠️ No instrument info, rounding the buy amount to 6 decimals.")
+        order_executor.submit("Buy", round_down_to_step(quantity, FALLBACK_ORDER_STEP), on_order_final(callback), on_placed)
+        return True
+    amount = instrument.round_amount(quantity)
+    error = instrument.check_buy(amount)
+    if error is not None:
+        order_executor.reject("Buy", amount, error, on_order_final(callback))
         return False
+    order_executor.submit("Buy", amount, on_order_final(callback), on_placed)
+    return True
 
-def sell(quantity):
-    try:
-        quantity = round_down(quantity, 6)
-        order = session.place_order(
-            category="spot",
-            symbol=config["TRADING_SYMBOL"],
-            side="Sell",
-            order_type="Market",
-            qty=quantity,
-        )
-        if not order or order.get("retCode", 1) != 0:
-            error_msg = order.get("retMsg", "Unknown error") if order else "No response from API"
-            logging.error(f"❌ Sell order failed for {quantity}: {error_msg}")
-            return False
-        logging.info(f"✅ Sell order placed for {quantity}")
+def sell(quantity, callback, price=None, on_placed=None):
+    """
+    Market sell of `quantity` of the invested coin, callback(fill) once the order is final (see OrderExecutor).
+    The quantity is rounded down to the instrument's quantity step; an order the exchange would reject
+    (below the minimum quantity, or worth less than the minimum order value at `price`) fails locally.
+    Returns True if the order was submitted.
+    """
+    instrument = get_instrument_info()
+    if instrument is None:
+        logging.warning("⚠️ No instrument info, rounding the sell quantity to 6 decimals.")
+        order_executor.submit("Sell", round_down_to_step(quantity, FALLBACK_ORDER_STEP), on_order_final(callback), on_placed)
         return True
-    except Exception as e:
-        logging.error(f"❌ Error placing sell order for {quantity}: {e}")
+    quantity = instrument.round_quantity(quantity)
+    error = instrument.check_sell(quantity, price)
+    if error is not None:
+        order_executor.reject("Sell", quantity, error, on_order_final(callback))
         return False
-    
+    order_executor.submit("Sell", quantity, on_order_final(callback), on_placed)
+    return True
+
+def track_order(order_id, side, quantity, callback):
+    """Follows an order placed before a restart, callback(fill) once it is final (see OrderExecutor)."""
+    order_executor.track(order_id, side, quantity, on_order_final(callback))
+
+def get_order_stats():
+    return order_executor.get_stats()
+
 def get_balance_for_symbol(symbol):
     try:
-        balance_data = session.get_wallet_balance(accountType="UNIFIED")
-        balances = balance_data['result']['list'][0]['coin']
-        for coin in balances:
-            if coin['coin'] == symbol:
-                return float(coin['walletBalance'])
+        return get_account_snapshot().get_balance(symbol)
     except Exception as e:
         logging.error(f"❌ Error fetching balance for {symbol}: {e}")
     return 0.0
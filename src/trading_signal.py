@@ -1,7 +1,12 @@
 from trading_api import *
 from chatbot_api import *
-import numpy as np  # Added for linear regression
+from indicator_cache import *
+import numpy as np
+import hashlib
+import json
+import math
 from tradingview_ta import TA_Handler, Interval
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # =======================================================
 # Trading signal
@@ -174,8 +179,8 @@ def get_trading_signal(market_state, responses):
     # --- Gemini AI ---
     # ---
 
-    # Check ai prompt, 1 if ai wants us to buy, -1 if ai wants us to sell
-    apply_weight("gemini_ai", responses["gemini"], 1, 1, -1, -1)
+    # Combined AI vote, from 1 (every model wants us to buy) to -1 (every model wants us to sell)
+    apply_weight("gemini_ai", responses["gemini"], 0, 1, -1, 0, inverse_buy=False, inverse_sell=True)
 
     # ---
     # --- DXY
@@ -237,80 +242,444 @@ def get_trading_signal(market_state, responses):
     return min(max(round(score / weights, 3), -1.0), 1.0)
 
 # =======================================================
-# Market state
+# Batch trading signal
 # =======================================================
 
-def get_market_state():
-    try:
-        news_sentiment = get_cryptopanic_sentiment()
-        if news_sentiment == -1:
-            logging.info("\t📰 Negative news sentiment detected.")
-        elif news_sentiment == 1:
-            logging.info("\t📰 Positive news sentiment detected.")
-        else:
-            logging.info("\t📰 Neutral news sentiment.")
-
-        fear_greed = get_fear_and_greed_index()
-        btc_dom = get_btc_dominance()
-
-        current_price = get_price_for_symbol(config["TRADING_SYMBOL"])
+RAINBOW_BAND_CODES = {str(color): color.value for color in RainbowColor}
+TRADINGVIEW_CODES = {"STRONG_SELL": -2, "SELL": -1, "NEUTRAL": 0, "BUY": 1, "STRONG_BUY": 2}
+UNKNOWN_CODE = -99
+
+def extract_signal_features(market_states, responses, trader_config=None):
+    """
+    Reduces market states to the indicator arrays scored by compile_signal_scorer().
+    Moving averages use the exact same expressions as get_trading_signal(), categorical
+    indicators (rainbow band, tradingview analysis) are encoded as integer codes.
+    """
+    trader_config = trader_config or config
+    ma_length = trader_config["MA_LENGTH"]
+    count = len(market_states)
+    features = {
+        "current_price": np.empty(count),
+        "ma": np.empty(count),
+        "ma_prev": np.empty(count),
+        "ath": np.empty(count),
+        "fear_greed": np.empty(count),
+        "news_sentiment": np.empty(count),
+        "days_since_last_halving": np.empty(count),
+        "google_trends": np.empty(count),
+        "gemini": np.empty(count),
+        "dxy_is_rising": np.empty(count, dtype=bool),
+        "dxy_is_falling": np.empty(count, dtype=bool),
+        "rainbow_band": np.empty(count, dtype=np.int64),
+        "tradingview_analysis": np.empty(count, dtype=np.int64),
+    }
+    as_float = lambda value: float("nan") if value is None else value  # Unavailable indicators never match a range
+    for i, (market_state, response) in enumerate(zip(market_states, responses)):
+        price_history = market_state["price_history"]
+        dxy_history = market_state["dxy_history"]
+        features["current_price"][i] = market_state["current_price"]
+        features["ma"][i] = sum(price_history[:ma_length]) / ma_length
+        features["ma_prev"][i] = sum(price_history[ma_length:ma_length * 2]) / ma_length
+        features["ath"][i] = max(price_history)
+        features["fear_greed"][i] = as_float(market_state["fear_greed"])
+        features["news_sentiment"][i] = as_float(market_state["news_sentiment"])
+        features["days_since_last_halving"][i] = as_float(market_state["days_since_last_halving"])
+        features["google_trends"][i] = as_float(market_state["google_trends"])
+        features["gemini"][i] = as_float(response.get("gemini"))
+        features["dxy_is_rising"][i] = all(x < y for x, y in zip(dxy_history, dxy_history[1:]))
+        features["dxy_is_falling"][i] = all(x > y for x, y in zip(dxy_history, dxy_history[1:]))
+        features["rainbow_band"][i] = RAINBOW_BAND_CODES.get(market_state["rainbow_band"], UNKNOWN_CODE)
+        features["tradingview_analysis"][i] = TRADINGVIEW_CODES.get(market_state["tradingview_analysis"], UNKNOWN_CODE)
+    return features
+
+# Config keys read by compile_signal_scorer(): two configs that agree on them score the same signals
+SIGNAL_SCORER_CONFIG_KEYS = (
+    "SIGNAL_WEIGHTS",
+    "FEAR_AND_GREED_EXTREME_FEAR",
+    "FEAR_AND_GREED_EXTREME_GREED",
+    "DAYS_HALVING_THRESHOLD",
+    "ATH_FAR_THRESHOLD",
+    "ATH_CLOSE_THRESHOLD",
+    "GOOGLE_TRENDS_LOW_POPULARITY_THRESHOULD",
+    "GOOGLE_TRENDS_HIGH_POPULARITY_THRESHOLD",
+)
+
+# Config keys that shape the market states and features themselves (extract_signal_features, synthetic history)
+SIGNAL_FEATURE_CONFIG_KEYS = ("MA_LENGTH", "DXY_LENGTH")
+
+def compile_signal_scorer(trader_config=None):
+    """
+    Compiles SIGNAL_WEIGHTS and the thresholds of `trader_config` into a batch scorer: a function that maps the
+    feature arrays of N market states (see extract_signal_features) to their N signals.
+    Results are numerically identical to calling get_trading_signal() on every market state.
+    """
+    trader_config = trader_config or config
+    signal_weights = trader_config["SIGNAL_WEIGHTS"]
+
+    # One rule per apply_weight() call of get_trading_signal(), in the same order:
+    # (weight, value feature, buy range, sell range, inverse buy, inverse sell, buy condition, sell condition)
+    # A value feature of None means ignore_ranges, conditions name a derived boolean array (None: always true)
+    rules = [
+        ("price_ma", None, None, None, True, False, "price_below_ma", "price_over_ma"),
+        ("fear_greed", "fear_greed",
+            (0, trader_config["FEAR_AND_GREED_EXTREME_FEAR"]), (trader_config["FEAR_AND_GREED_EXTREME_GREED"], 100),
+            True, False, None, None),
+        ("news", "news_sentiment", (1, 1), (-1, -1), True, False, None, None),
+        ("halving", "days_since_last_halving", (0, trader_config["DAYS_HALVING_THRESHOLD"]), (0, 0),
+            False, False, None, "never"),
+        ("ath", "price_percentage_ath",
+            (0, trader_config["ATH_FAR_THRESHOLD"]), (trader_config["ATH_CLOSE_THRESHOLD"], 1.0),
+            True, False, "downtrend", "uptrend"),
+        ("google_trends", "google_trends",
+            (0, trader_config["GOOGLE_TRENDS_LOW_POPULARITY_THRESHOULD"]), (trader_config["GOOGLE_TRENDS_HIGH_POPULARITY_THRESHOLD"], 100),
+            True, False, None, None),
+        ("rainbow_btc_strong", None, None, None, True, False, "rainbow_fire_sale", "rainbow_max_bubble"),
+        ("rainbow_btc", None, None, None, True, False, "rainbow_buy", "rainbow_sell_please"),
+        ("gemini_ai", "gemini", (0, 1), (-1, 0), False, True, None, None),
+        ("dxy", None, None, None, True, False, "dxy_is_falling", "dxy_is_rising"),
+        ("tradingview_analysis_strong", None, None, None, True, False, "tradingview_strong_buy", "tradingview_strong_sell"),
+        ("tradingview_analysis", None, None, None, True, False, "tradingview_buy", "tradingview_sell"),
+    ]
+
+    compiled_rules = []
+    weights = 0
+    for name, value_key, buy_range, sell_range, inverse_buy, inverse_sell, buy_condition, sell_condition in rules:
+        weight = signal_weights[name]
+        weights += weight
+        compiled_rules.append((weight, value_key, buy_range, sell_range, inverse_buy, inverse_sell, buy_condition, sell_condition))
+
+    def range_alpha(value, range_min, range_max, inverse):
+        dim = range_max - range_min
+        if dim <= 0:
+            return 1.0
+        alpha = np.maximum(0.0, np.minimum((value - range_min) / dim, 1.0))
+        return 1.0 - alpha if inverse else alpha
+
+    def score(features):
+        count = len(features["current_price"])
+        if weights == 0:
+            return np.zeros(count)
+
+        current_price = features["current_price"]
+        ma = features["ma"]
+        slope = ma - features["ma_prev"]
+        rainbow_band = features["rainbow_band"]
+        tradingview_analysis = features["tradingview_analysis"]
+        derived = {
+            "fear_greed": features["fear_greed"],
+            "news_sentiment": features["news_sentiment"],
+            "days_since_last_halving": features["days_since_last_halving"],
+            "google_trends": features["google_trends"],
+            "gemini": features["gemini"],
+            "price_percentage_ath": current_price / features["ath"],
+            "price_below_ma": current_price < ma,
+            "price_over_ma": current_price > ma,
+            "uptrend": slope > 0,
+            "downtrend": slope < 0,
+            "never": np.zeros(count, dtype=bool),
+            "rainbow_fire_sale": rainbow_band == RainbowColor.BASICALLY_FIRE_SALE.value,
+            "rainbow_max_bubble": rainbow_band == RainbowColor.MAX_BUBBLE_TERRITORY.value,
+            "rainbow_buy": rainbow_band == RainbowColor.BUY.value,
+            "rainbow_sell_please": rainbow_band == RainbowColor.SELL_PLEASE.value,
+            "dxy_is_falling": features["dxy_is_falling"],
+            "dxy_is_rising": features["dxy_is_rising"],
+            "tradingview_strong_buy": tradingview_analysis == TRADINGVIEW_CODES["STRONG_BUY"],
+            "tradingview_strong_sell": tradingview_analysis == TRADINGVIEW_CODES["STRONG_SELL"],
+            "tradingview_buy": tradingview_analysis == TRADINGVIEW_CODES["BUY"],
+            "tradingview_sell": tradingview_analysis == TRADINGVIEW_CODES["SELL"],
+        }
+        always = np.ones(count, dtype=bool)
+
+        total = np.zeros(count)
+        for weight, value_key, buy_range, sell_range, inverse_buy, inverse_sell, buy_condition, sell_condition in compiled_rules:
+            condition_buy = derived[buy_condition] if buy_condition else always
+            condition_sell = derived[sell_condition] if sell_condition else always
+            if value_key is None:
+                buy_applied = condition_buy
+                sell_applied = ~buy_applied & condition_sell
+                buy_alpha = sell_alpha = 1.0
+            else:
+                value = derived[value_key]
+                buy_applied = (value >= buy_range[0]) & (value <= buy_range[1]) & condition_buy
+                sell_applied = ~buy_applied & (value >= sell_range[0]) & (value <= sell_range[1]) & condition_sell
+                buy_alpha = range_alpha(value, buy_range[0], buy_range[1], inverse_buy)
+                sell_alpha = range_alpha(value, sell_range[0], sell_range[1], inverse_sell)
+            # Adding and subtracting 0.0 keeps the per-state sums bit for bit equal to the scalar path
+            total = total + np.where(buy_applied, weight * buy_alpha, 0.0) - np.where(sell_applied, weight * sell_alpha, 0.0)
+
+        # Python round() on purpose: np.round rounds some halfway values differently
+        return np.array([min(max(round(x, 3), -1.0), 1.0) for x in (total / weights).tolist()])
+
+    return score
+
+def get_trading_signal_batch(market_states, responses, trader_config=None):
+    features = extract_signal_features(market_states, responses, trader_config)
+    return compile_signal_scorer(trader_config)(features)
 
-        halving = get_halving_info()
+# =======================================================
+# Market state
+# =======================================================
 
-        price_history_raw = get_price_history(config["TRADING_SYMBOL"], interval="W", limit=max(config["MA_LENGTH"] * 2, 120))
-        price_history = [x['price'] for x in price_history_raw] if price_history_raw else []
+def get_tradingview_analysis():
+    handler = TA_Handler(
+        symbol=config["TRADING_SYMBOL"],
+        screener="crypto",
+        exchange="BINANCE",
+        interval=Interval.INTERVAL_1_MONTH,
+    )
+    return handler.get_analysis().summary["RECOMMENDATION"]
+
+def get_rainbow_band_values():
+    # JSON friendly (band name instead of the enum) so it can live in the indicator cache
+    band, price, base_price = get_bitcoin_rainbow_band()
+    return [str(band), price, base_price]
+
+def fetch_concurrently(sources, default_timeout, timeouts=None):
+    """
+    Runs every callable in `sources` (name -> callable) on its own worker thread.
+    Each source must finish within its timeout (seconds, counted from the moment all sources are started),
+    otherwise a TimeoutError is raised. Errors raised by a source are propagated.
+    Returns a dict name -> result.
+    """
+    timeouts = timeouts or {}
+    executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="market_state")
+    try:
+        started = time.monotonic()
+        futures = {name: executor.submit(fetch) for name, fetch in sources.items()}
+        results = {}
+        for name, future in futures.items():
+            deadline = started + timeouts.get(name, default_timeout)
+            try:
+                results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                raise TimeoutError(f"source '{name}' did not respond within {timeouts.get(name, default_timeout)}s")
+            except Exception as e:
+                raise RuntimeError(f"source '{name}' failed: {e}") from e
+        return results
+    finally:
+        # Never wait for a hung source, its result is discarded anyway
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Only values passing these checks are stored in the indicator cache (default: not None)
+INDICATOR_VALIDATORS = {
+    "halving": lambda v: isinstance(v, dict),
+    "dxy_history": lambda v: isinstance(v, list) and len(v) > 0,  # get_dxy_history returns a message on failure
+    "google_trends": lambda v: v is not None,
+    "rainbow": lambda v: isinstance(v, list) and len(v) == 3,
+}
+
+def get_replayed_market_state():
+    """Market state recorded at the simulated time, priced by the simulated exchange (no network)."""
+    market_state = session.replay.market_state_at(clock.time())
+    if not market_state:
+        logging.error("❌ No recorded market state to replay. Skipping...")
+        return None
+    return dict(market_state, current_price=get_price_for_symbol(config["TRADING_SYMBOL"]))
 
-        google_trends = get_today_google_search("bitcoin")
+def get_market_state():
+    if is_simulated_exchange():
+        return get_replayed_market_state()
+
+    sources = {
+        "news_sentiment": get_cryptopanic_sentiment,
+        "fear_greed": get_fear_and_greed_index,
+        "btc_dom": get_btc_dominance,
+        "current_price": lambda: get_price_for_symbol(config["TRADING_SYMBOL"]),
+        "halving": get_halving_info,
+        "price_history": lambda: get_price_history(config["TRADING_SYMBOL"], interval="W", limit=max(config["MA_LENGTH"] * 2, 120)),
+        "google_trends": lambda: get_today_google_search("bitcoin"),
+        "rainbow": get_rainbow_band_values,
+        "tradingview_analysis": get_tradingview_analysis,
+        "dxy_history": lambda: get_dxy_history(lookback_weeks=config["DXY_LENGTH"]),
+    }
 
-        rainbow_band, rainbow_price, rainbow_base_price = get_bitcoin_rainbow_band()
+    # Slow-moving sources are served from the indicator cache until their TTL expires
+    ttls = config.get("INDICATOR_CACHE_TTL_SECONDS", {})
+    fetched_at = {}
+    def cached(name, fetch):
+        def fetch_cached():
+            value, fetched_at[name] = indicator_cache.get(name, fetch, ttls.get(name, 0), INDICATOR_VALIDATORS.get(name))
+            return value
+        return fetch_cached
 
-        handler = TA_Handler(
-            symbol=config["TRADING_SYMBOL"],
-            screener="crypto",
-            exchange="BINANCE",
-            interval=Interval.INTERVAL_1_MONTH,
+    try:
+        results = fetch_concurrently(
+            {name: cached(name, fetch) for name, fetch in sources.items()},
+            default_timeout=config.get("MARKET_STATE_FETCH_TIMEOUT_SECONDS", 30),
+            timeouts=config.get("MARKET_STATE_SOURCE_TIMEOUTS", {})
         )
-
-        tradingview_analysis = handler.get_analysis().summary["RECOMMENDATION"]
-
-        dxy_history = get_dxy_history(lookback_weeks=config["DXY_LENGTH"])
-
     except Exception as e:
         logging.error(f"❌ Error fetching necessary indicators for trade decision: {e} Skipping...")
         return None
-    
+
+    news_sentiment = results["news_sentiment"]
+    if news_sentiment == -1:
+        logging.info("\t📰 Negative news sentiment detected.")
+    elif news_sentiment == 1:
+        logging.info("\t📰 Positive news sentiment detected.")
+    else:
+        logging.info("\t📰 Neutral news sentiment.")
+
+    halving = results["halving"]
+    price_history_raw = results["price_history"]
+    price_history = [x['price'] for x in price_history_raw] if price_history_raw else []
+    rainbow_band, rainbow_price, rainbow_base_price = results["rainbow"]
+
     return {
-        "current_price": current_price,
+        "current_price": results["current_price"],
         "price_history": price_history,
-        "fear_greed": fear_greed,
-        "btc_dom": btc_dom,
+        "fear_greed": results["fear_greed"],
+        "btc_dom": results["btc_dom"],
         "news_sentiment": news_sentiment,
         "days_until_next_halving": halving["days_until_next_halving"],
         "days_since_last_halving": halving["days_since_last_halving"],
-        "google_trends": google_trends,
+        "google_trends": results["google_trends"],
         "rainbow_band": str(rainbow_band),
-        "tradingview_analysis": tradingview_analysis,
-        "dxy_history": dxy_history
+        "tradingview_analysis": results["tradingview_analysis"],
+        "dxy_history": results["dxy_history"],
+        "fetched_at": {name: round(fetched_at[name], 3) for name in sources},
     }
 
 # =======================================================
 # AI Responses
 # =======================================================
 
-def get_ai_responses(market_state):
-    ai_prompt = f"""Analyze the current market state: {market_state}. 
+def flatten_values(values):
+    # yfinance may return one-element rows ([[close], ...]) depending on its version
+    return [v[0] if isinstance(v, list) else v for v in values] if isinstance(values, list) else []
+
+def get_market_features(market_state):
+    """
+    Derived features of a market state, roughly in order of importance for the AI prompt.
+    Long series (price_history newest first, dxy_history oldest first) are summarized, never sent raw.
+    """
+    price = market_state.get("current_price")
+    price_history = market_state.get("price_history") or []
+    dxy_history = flatten_values(market_state.get("dxy_history"))
+    ma_length = config["MA_LENGTH"]
+    features = {"price": round(price, 2) if price else price}
+
+    if price and len(price_history) >= ma_length:
+        ma = sum(price_history[:ma_length]) / ma_length
+        features[f"ma_{ma_length}w"] = round(ma, 2)
+        features["price_vs_ma_pct"] = round((price / ma - 1.0) * 100, 1)
+        if len(price_history) >= ma_length * 2:
+            ma_prev = sum(price_history[ma_length:ma_length * 2]) / ma_length
+            features["ma_slope_pct"] = round((ma / ma_prev - 1.0) * 100, 1)
+    if price and price_history:
+        ath = max(price_history)
+        features["price_pct_of_ath"] = round(price / ath * 100, 1)
+        for weeks in (4, 12, 52):
+            if len(price_history) > weeks:
+                features[f"change_{weeks}w_pct"] = round((price / price_history[weeks] - 1.0) * 100, 1)
+
+    for key in ("fear_greed", "btc_dom", "news_sentiment", "google_trends", "tradingview_analysis"):
+        if market_state.get(key) is not None:
+            value = market_state[key]
+            features[key] = round(value, 1) if isinstance(value, float) else value
+    if market_state.get("rainbow_band"):
+        features["rainbow_band"] = str(market_state["rainbow_band"]).replace("RainbowColor.", "")
+    for key in ("days_since_last_halving", "days_until_next_halving"):
+        if market_state.get(key) is not None:
+            features[key] = int(market_state[key])
+
+    if len(dxy_history) >= 2:
+        features["dxy"] = round(dxy_history[-1], 2)
+        features[f"dxy_change_{len(dxy_history)}w_pct"] = round((dxy_history[-1] / dxy_history[0] - 1.0) * 100, 2)
+        recent = dxy_history[-4:]
+        if all(x < y for x, y in zip(recent, recent[1:])):
+            features["dxy_trend_4w"] = "rising"
+        elif all(x > y for x, y in zip(recent, recent[1:])):
+            features["dxy_trend_4w"] = "falling"
+        else:
+            features["dxy_trend_4w"] = "mixed"
+    return features
+
+def estimate_tokens(text):
+    # ~4 characters per token for English and numbers, close enough for budgeting
+    return (len(text) + 3) // 4
+
+AI_PROMPT_INSTRUCTIONS = """Please strictly respond with only one integer value:
+respond with -1 if you think its a good time to sell and bad time to buy;
+respond with 1 if you think its good time to buy or bad time to sell;
+respond with 0 if you are neutral about buying/selling;"""
+
+def build_ai_prompt(market_state, token_budget=None):
+    """
+    Compact prompt: one "name: value" line per derived feature. Features are dropped from the end
+    (least important first) until the prompt fits `token_budget` (AI_PROMPT_TOKEN_BUDGET by default).
+    """
+    token_budget = token_budget or config.get("AI_PROMPT_TOKEN_BUDGET", 200)
+    symbol = config["INVESTED_SYMBOL"]
+    lines = [f"{k}: {v}" for k, v in get_market_features(market_state).items()]
+    while True:
+        prompt = f"{symbol} market summary (weekly candles, percentages in %):\n" + "\n".join(lines) + "\n" + AI_PROMPT_INSTRUCTIONS
+        if estimate_tokens(prompt) <= token_budget or not lines:
+            return prompt
+        lines.pop()
+
+def build_raw_ai_prompt(market_state):
+    """Prompt with the whole market state dict, as sent before the compact prompt (benchmark baseline)."""
+    return f"""Analyze the current market state: {market_state}. 
     Please strictly respond with only one integer value: 
     respond with -1 if you think its a good time to sell and bad time to buy;
     respond with 1 if you think its good time to buy or bad time to sell;
     respond with 0 if you are neutral about buying/selling;"""
 
-    # Gemini
-    raw_gemini_response = get_gemini_response(ai_prompt)
-    try:
-        gemini_response = int(raw_gemini_response) if raw_gemini_response is not None else 0
-    except ValueError:
-        gemini_response = 0  # fallback in case response is not a valid integer
-    
+# Market states that only differ by less than these steps share their AI responses.
+# Prices (and price-like series) are quantized on a log scale, AI_RESPONSE_CACHE.PRICE_STEP_PCT apart.
+AI_FINGERPRINT_STEPS = {
+    "fear_greed": 5,
+    "btc_dom": 0.5,
+    "google_trends": 5,
+    "days_until_next_halving": 7,
+    "days_since_last_halving": 7,
+}
+AI_FINGERPRINT_PRICE_FIELDS = ("current_price", "price_history", "dxy_history")
+AI_FINGERPRINT_IGNORED_FIELDS = ("fetched_at",)
+AI_PROMPT_VERSION = 2
+
+def get_market_fingerprint(market_state):
+    """Hash of the normalized, quantized market state, used as the AI response cache key."""
+    price_step = math.log1p(config.get("AI_RESPONSE_CACHE", {}).get("PRICE_STEP_PCT", 0.01))
+
+    def quantize_price(value):
+        return round(math.log(value) / price_step) if isinstance(value, (int, float)) and value > 0 else value
+
+    normalized = {}
+    for key, value in market_state.items():
+        if key in AI_FINGERPRINT_IGNORED_FIELDS:
+            continue
+        if key in AI_FINGERPRINT_PRICE_FIELDS:
+            normalized[key] = [quantize_price(v) for v in value] if isinstance(value, list) else quantize_price(value)
+        elif key in AI_FINGERPRINT_STEPS and isinstance(value, (int, float)):
+            normalized[key] = round(value / AI_FINGERPRINT_STEPS[key])
+        else:
+            normalized[key] = value
+    payload = json.dumps([AI_PROMPT_VERSION, normalized], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def get_ai_responses(market_state):
+    if is_simulated_exchange():
+        return dict(session.replay.responses_at(clock.time()))
+
+    ai_prompt = build_ai_prompt(market_state)
+
+    # Every provider votes -1/0/1, answers are reused while the market state stays within the same quantization steps
+    provider_weights = {p.name: p.weight for p in ai_providers}
+    raw_responses = get_ai_provider_responses(ai_prompt, get_market_fingerprint(market_state))
+    votes = {}
+    for name, raw_response in raw_responses.items():
+        try:
+            votes[name] = max(-1, min(int(raw_response), 1))
+        except ValueError:
+            logging.warning(f"⚠️ Ignoring invalid response from AI provider {name}: {raw_response!r}")
+
+    # Weighted mean of the votes that arrived in time, kept under "gemini" (gemini_ai weight, recorded history)
+    voted_weight = sum(provider_weights[name] for name in votes)
+    combined_vote = sum(provider_weights[name] * vote for name, vote in votes.items()) / voted_weight if voted_weight > 0 else 0
+
     return {
-        "gemini": gemini_response,
+        "gemini": round(combined_vote, 3),
+        "votes": votes,
     }